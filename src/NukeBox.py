@@ -2,8 +2,10 @@
 
 # from collections import deque
 from NukeBoxQueue import NukeBoxQueue
+from NukeBoxJournal import NukeBoxJournal
+from NukeBoxConfig import config
 
-from twistedServer import NukeBoxBroadcastReceiver, NukeboxFactory
+from twistedServer import NukeBoxBroadcastReceiver, NukeboxFactory, playBack
 
 from twisted.internet import reactor
 
@@ -11,60 +13,20 @@ from twisted.internet.threads import deferToThread
 
 import os
 import signal
-import subprocess
 
 
 if __name__ == '__main__':
 
-    def playBack():
-
-        '''
-        File PlayBack Function
- 
-          - Runs in Thread of its own
-          - Continues to check the Queue for new entries
-          - Calls VLC CLI command to play file
-        '''
-
-        print('Playback called!')
-
-        # While the Server is UP
-        while True:
-
-            # If there is an Entry in the Queue
-            if len(q) > 0:
-
-                # Pull the Entry at Index 0
-                user_path = q.popleft()
-
-                # Split the String into a User ID & File Path
-                mac_id, path = user_path.split(':')
-
-                print('User {} - Playing {}').format(mac_id, path)
-
-                # If the File Does Exist
-                if os.path.isfile(path):
-
-                    print('File Exists')
-
-                    # Create a String to Call CLVC (VLC command line!)
-                    file = 'cvlc --play-and-exit {}'.format(path)
-
-                    # Execute the Command in a Sub Process
-                    subprocess.call(file, shell=True)
-
     def cleanUp(signal, frame):
 
         '''
         Called to Exit somewhat gracefully
         '''
 
+        q.close()
         reactor.stop()
         os._exit(0)
 
-    # Create the Double Ended Queue (Deque)
-    q = NukeBoxQueue()
-
     # Create a Reference to the Users Home Dir
     HOME = os.path.expanduser('~')
 
@@ -80,6 +42,9 @@ if __name__ == '__main__':
     if not os.path.isdir(temp_dir):
         os.makedirs(temp_dir)
 
+    # Create the Play Queue, Recovering it from its Journal
+    q = NukeBoxQueue(NukeBoxJournal(default_dir + '.queue.journal'))
+
     # Create the Factory Instance
     f = NukeboxFactory(q, default_dir, temp_dir)
 
@@ -92,11 +57,14 @@ if __name__ == '__main__':
     # Notify the Reactor to Listen for UDP Connections
     reactor.listenUDP(9009, protocol)
 
+    # Connect to the DB in the Background, once we're Listening
+    reactor.callWhenRunning(f.db.warmUp)
+
     # Add the Shutdown Signal Handler
     signal.signal(signal.SIGINT, cleanUp)
 
     # Defer the Playback Function to its Own Thread
-    deferToThread(playBack)
+    deferToThread(playBack, q, config.get('player', 'sink'), f)
 
     # Run the Reactor
     reactor.run()
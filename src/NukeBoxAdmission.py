@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+
+import os
+import time
+
+from NukeBoxConfig import config
+
+
+class NukeBoxBucket(object):
+
+    '''
+    B{NukeBox 2000 Bucket Class}
+
+      - Token Bucket Limiting one Client's Upload Rate
+      - Responsible for:
+
+        - Refilling at "rate" Bytes per sec, up to a Second's Worth
+        - Saying how long to Stop Reading once a Client Overspends
+    '''
+
+    def __init__(self, rate, clock=time.time):
+
+        '''
+        Bucket Constructor
+        '''
+
+        self.rate = float(rate)
+        self.clock = clock
+
+        self.tokens = self.rate
+        self.stamp = clock()
+
+    def take(self, size):
+
+        '''
+        Spends "size" Bytes, Returns the secs to Wait before Reading more
+        (0 if there's No Need)
+        '''
+
+        now = self.clock()
+        self.tokens = min(self.rate,
+                          self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+        self.tokens -= size
+        return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class NukeBoxAdmission(object):
+
+    '''
+    B{NukeBox 2000 Admission Class}
+
+      - Admission Control for the Server, Shared by every Session
+      - Responsible for:
+
+        - Limiting the Registered Sessions & the Uploads in Progress, those
+          over the Limit Wait their Turn (First Come, First Served)
+        - Limiting the Bytes those Uploads Announced
+        - Refusing Uploads the Limits or the Temp Disk can never Take,
+          Counting what Uploads Already Admitted have still to Write
+        - Handing each Client a Bucket Limiting its Rate
+        - Bounding the Chunk Frames Uploads are Sent in
+
+    Nothing here Touches a Transport, the Caller Pauses a Client while it
+    Waits & is Called back once it may Carry on. An Upload Holds its Place
+    until it is Stored (or Dropped), so Validation is Bounded too.
+
+    Grants are Called from within release & unregister, i.e. from
+    Whichever Session Freed the Place, so a Grant should only Schedule
+    the Waiting Session's Work (e.g. with reactor.callLater).
+
+    B{Syntax}
+
+      >>> admission = NukeBoxAdmission('/tmp/NukeBox2000/')
+      >>> if admission.admit(key, size, grant):
+      ...     startNow()
+      >>> admission.wrote(key, received)
+      >>> admission.release(key)
+    '''
+
+    def __init__(self, temp_dir, sessions=None, transfers=None,
+                 in_flight=None, rate=None, watermark=None, chunk=None):
+
+        '''
+        Admission Constructor
+
+          - Defaults to the [admission] Settings in the Config
+          - A Limit of 0 is No Limit
+        '''
+
+        def setting(value, key):
+            return value if value is not None else \
+                config.getint('admission', key)
+
+        self.temp = temp_dir
+
+        self.max_sessions = setting(sessions, 'sessions')
+        self.max_transfers = setting(transfers, 'transfers')
+        self.max_bytes = setting(in_flight, 'bytes')
+        self.rate = setting(rate, 'rate')
+        self.watermark = setting(watermark, 'watermark')
+        self.max_chunk = setting(chunk, 'chunk')
+
+        # Admitted Keys (-> Announced Bytes for Transfers)
+        self.sessions = set()
+        self.transfers = {}
+
+        # Bytes Admitted Transfers have on the Disk so far
+        self.written = {}
+
+        # Keys Waiting their Turn, with what to Call once Admitted
+        self.waiting_sessions = []
+        self.waiting_transfers = []
+
+    def bucket(self):
+
+        '''
+        Returns a New Client's Bucket, or None if Rates aren't Limited
+        '''
+
+        return NukeBoxBucket(self.rate) if self.rate else None
+
+    def free(self):
+
+        '''
+        Returns the Bytes Free on the Temp Directory's Disk
+        '''
+
+        stats = os.statvfs(self.temp)
+        return stats.f_bavail * stats.f_frsize
+
+    def pending(self, exclude=None):
+
+        '''
+        Returns the Bytes Admitted Transfers (but "exclude") are still to
+        Write
+        '''
+
+        return sum(max(size - self.written.get(key, 0), 0)
+                   for key, size in self.transfers.items()
+                   if key is not exclude)
+
+    def check(self, size, key=None):
+
+        '''
+        Returns why an Upload of "size" Bytes can never be Admitted, or
+        None if it can
+
+          - The Disk must Hold it as well as what the Uploads Admitted
+            Already are still to Write, "key" Names the Upload itself
+            if it is one of them
+        '''
+
+        if self.max_bytes and size > self.max_bytes:
+            return 'File too Large'
+
+        if self.free() - self.watermark - self.pending(key) < size:
+            return 'Not Enough Disk Space'
+
+        return None
+
+    def register(self, key, grant):
+
+        '''
+        Admits a Session, Returns True if it may Register Now
+
+          - Otherwise "grant" is Called once it may
+        '''
+
+        if not self.waiting_sessions and self.sessionRoom():
+            self.sessions.add(key)
+            return True
+
+        self.waiting_sessions.append((key, grant))
+        return False
+
+    def admit(self, key, size, grant):
+
+        '''
+        Admits an Upload of "size" Bytes, Returns True if it may Start Now
+
+          - Otherwise "grant" is Called once it may
+        '''
+
+        if not self.waiting_transfers and self.transferRoom(size):
+            self.transfers[key] = size
+            return True
+
+        self.waiting_transfers.append((key, size, grant))
+        return False
+
+    def wrote(self, key, size):
+
+        '''
+        Records that an Admitted Upload has "size" Bytes on the Disk
+        '''
+
+        if key in self.transfers:
+            self.written[key] = size
+
+    def unregister(self, key):
+
+        '''
+        Frees a Session's Place (or Stops it Waiting for one)
+        '''
+
+        self.sessions.discard(key)
+        self.waiting_sessions = [(k, grant) for k, grant
+                                 in self.waiting_sessions if k is not key]
+        self.wake()
+
+    def release(self, key):
+
+        '''
+        Frees an Upload's Place (or Stops it Waiting for one)
+        '''
+
+        self.transfers.pop(key, None)
+        self.written.pop(key, None)
+        self.waiting_transfers = [(k, size, grant) for k, size, grant
+                                  in self.waiting_transfers if k is not key]
+        self.wake()
+
+    def sessionRoom(self):
+
+        '''
+        Returns True if Another Session Fits
+        '''
+
+        return not self.max_sessions or \
+            len(self.sessions) < self.max_sessions
+
+    def transferRoom(self, size):
+
+        '''
+        Returns True if Another Upload of "size" Bytes Fits
+        '''
+
+        if self.max_transfers and len(self.transfers) >= self.max_transfers:
+            return False
+
+        # A Lone Upload is Always Let in, check Refuses any too Large
+        return not self.max_bytes or not self.transfers or \
+            sum(self.transfers.values()) + size <= self.max_bytes
+
+    def wake(self):
+
+        '''
+        Admits Waiting Sessions & Uploads, in Order, while they Fit
+        '''
+
+        while self.waiting_sessions and self.sessionRoom():
+            key, grant = self.waiting_sessions.pop(0)
+            self.sessions.add(key)
+            grant()
+
+        while self.waiting_transfers and \
+                self.transferRoom(self.waiting_transfers[0][1]):
+            key, size, grant = self.waiting_transfers.pop(0)
+            self.transfers[key] = size
+            grant()
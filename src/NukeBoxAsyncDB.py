@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+from twisted.internet import reactor
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+
+from NukeBoxConfig import config
+
+
+# URLs of an In Memory DB, one Connection that Queries must Take Turns on
+MEMORY_URLS = ('sqlite://', 'sqlite:///:memory:')
+
+
+class NukeBoxAsyncDB(object):
+
+    '''
+    B{NukeBox 2000 Asynchronous Database Class}
+
+      - Non-Blocking Wrapper around the NukeBoxQuery Class
+      - Responsible for:
+
+        - Running each Query in a Bounded Pool of Worker Threads
+        - Returning a Deferred that Fires with the Result on the Reactor
+
+    The Pool is Separate from the Reactor's own, so a Slow DB can never
+    Starve the Hashing & Playback Threads (and vice versa). NukeBoxDB (&
+    SQLAlchemy) are only Imported by the Worker Threads, Keeping them out
+    of the Server's Startup.
+
+    B{Syntax}
+
+      >>> db = NukeBoxAsyncDB()
+      >>> d = db.read(**{'Model': 'Users', 'mac_id': '0987654321'})
+      >>> d.addCallback(lambda user: user.name)
+    '''
+
+    def __init__(self, maxthreads=None):
+
+        '''
+        Async DB Constructor
+
+          - "maxthreads" Bounds how many Queries Run at once, by Default
+            one per Pooled DB Connection
+          - The Pool Starts with the First Query, or warmUp
+        '''
+
+        if maxthreads is None:
+            if config.get('db', 'url') in MEMORY_URLS:
+                maxthreads = 1
+            else:
+                maxthreads = config.getint('db', 'pool_size')
+
+        self.pool = ThreadPool(minthreads=0, maxthreads=maxthreads,
+                               name='NukeBoxDB')
+        self.started = False
+
+    def start(self):
+
+        '''
+        Starts the Worker Threads & Stops them again at Shutdown
+        '''
+
+        if not self.started:
+            self.started = True
+            self.pool.start()
+            reactor.addSystemEventTrigger('during', 'shutdown', self.stop)
+
+    def stop(self):
+
+        '''
+        Waits for Running Queries & Stops the Worker Threads
+        '''
+
+        if self.started:
+            self.started = False
+            self.pool.stop()
+
+    def warmUp(self):
+
+        '''
+        Connects & Verifies the Schema in the Background
+
+          - Returns a Deferred, Queries Made Meanwhile just Wait for it
+          - On Failure the First Query Tries Again
+        '''
+
+        self.start()
+        d = deferToThreadPool(reactor, self.pool, self.setup)
+        d.addErrback(self.warmUpFailed)
+        return d
+
+    def warmUpFailed(self, failure):
+
+        '''
+        Reports a Failed Warm Up
+        '''
+
+        print('DB Warm Up Failed: {}'.format(failure.getErrorMessage()))
+
+    def setup(self):
+
+        '''
+        Runs in a Worker Thread, see NukeBoxDB.setup
+
+          - Builds the Search Index too, so the First Search is Quick
+        '''
+
+        from NukeBoxDB import setup, NukeBoxQuery
+        setup()
+
+        with NukeBoxQuery() as nbq:
+            nbq.index()
+
+    def run(self, method, *args, **kwargs):
+
+        '''
+        Calls a NukeBoxQuery Method in the Pool
+
+          - Returns a Deferred Firing with its Return Value
+          - Exceptions (e.g. NoResultFound) Arrive as a Failure
+        '''
+
+        self.start()
+        return deferToThreadPool(reactor, self.pool,
+                                 self.query, method, args, kwargs)
+
+    def query(self, method, args, kwargs):
+
+        '''
+        Runs in a Worker Thread, one NukeBoxQuery per Call
+        '''
+
+        from NukeBoxDB import NukeBoxQuery
+
+        with NukeBoxQuery() as nbq:
+            return getattr(nbq, method)(*args, **kwargs)
+
+    def create(self, details):
+
+        '''
+        Deferred Version of NukeBoxQuery.create
+        '''
+
+        # Copied, the Query Deletes the 'Model' Key
+        return self.run('create', dict(details))
+
+    def read(self, **details):
+
+        '''
+        Deferred Version of NukeBoxQuery.read
+        '''
+
+        return self.run('read', **details)
+
+    def update(self, **details):
+
+        '''
+        Deferred Version of NukeBoxQuery.update
+        '''
+
+        return self.run('update', **details)
+
+    def delete(self, **details):
+
+        '''
+        Deferred Version of NukeBoxQuery.delete
+        '''
+
+        return self.run('delete', **details)
+
+    def search(self, query, page=1, per_page=20):
+
+        '''
+        Deferred Version of NukeBoxQuery.search
+        '''
+
+        return self.run('search', query, page, per_page)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+import time
+import threading
+import collections
+
+
+class NukeBoxCache(object):
+
+    '''
+    B{NukeBox 2000 Cache Class}
+
+      - Least Recently Used Cache with a Time to Live
+      - Responsible for:
+
+        - Holding up to "size" Entries, Dropping the Least Recently Used
+        - Expiring Entries "ttl" secs after they were Stored
+        - Counting Hits & Misses
+
+    Safe to Share between Threads. Keys are Tuples, str Parts are Compared
+    as unicode so a Key Matches whichever Type the DB Hands back.
+
+    B{Syntax}
+
+      >>> cache = NukeBoxCache(size=1024, ttl=300)
+      >>> cache.put(('Users', 'mac_id', '0987654321'), user)
+      >>> user = cache.get(('Users', 'mac_id', '0987654321'))
+    '''
+
+    def __init__(self, size=4096, ttl=300):
+
+        '''
+        Cache Constructor
+        '''
+
+        self.size = size
+        self.ttl = ttl
+
+        # Key -> (Expiry Time, Value), Oldest Use First
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, parts):
+
+        '''
+        Normalises a Key, Decoding any str Parts
+        '''
+
+        return tuple(part.decode('utf-8') if isinstance(part, str) else part
+                     for part in parts)
+
+    def get(self, key, default=None):
+
+        '''
+        Returns the Cached Value, or "default" on a Miss
+        '''
+
+        key = self.key(key)
+
+        with self.lock:
+            entry = self.entries.pop(key, None)
+
+            if entry is None or entry[0] < time.time():
+                self.misses += 1
+                return default
+
+            # Most Recently Used Goes to the End
+            self.entries[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+
+        '''
+        Stores a Value, Evicting the Least Recently Used if Full
+        '''
+
+        key = self.key(key)
+
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time.time() + self.ttl, value)
+
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+
+        '''
+        Drops one Entry
+        '''
+
+        with self.lock:
+            self.entries.pop(self.key(key), None)
+
+    def invalidatePrefix(self, prefix):
+
+        '''
+        Drops every Entry whose Key Starts with the Given Parts
+        '''
+
+        prefix = self.key(prefix)
+
+        with self.lock:
+            for key in [k for k in self.entries if k[:len(prefix)] == prefix]:
+                del self.entries[key]
+
+    def clear(self):
+
+        '''
+        Drops Everything, the Counters are Kept
+        '''
+
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+
+        '''
+        Returns the Counters, e.g. for Logging
+        '''
+
+        lookups = self.hits + self.misses
+
+        return {'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': float(self.hits) / lookups if lookups else 0.0
+                }
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+
+import struct
+
+from twisted.internet import protocol
+
+
+# Frame Header - Magic, Version, Message Type, Metadata Length, Payload Length
+HEADER = struct.Struct('!2sBBHQ')
+MAGIC = 'NB'
+VERSION = 1
+
+# Message Types
+REGISTER = 1
+READY = 2
+FILE = 3
+ACK = 4
+ERROR = 5
+QUERY = 6
+HAVE = 7
+CHUNK = 8
+NACK = 9
+SEARCH = 10
+RESULTS = 11
+REQUEST = 12
+QUEUED = 13
+
+# Metadata Value Types
+_INT = struct.Struct('!q')
+_FLOAT = struct.Struct('!d')
+_LEN = struct.Struct('!H')
+
+
+class FrameError(Exception):
+
+    '''
+    Raised when a Frame or its Metadata Block cannot be decoded
+    '''
+
+
+def encodeMeta(meta):
+
+    '''
+    Packs a flat Dictionary into the compact Metadata Block
+
+      - Keys are short strings
+      - Values may be None, bool, int, long, float, str or unicode
+      - Each entry is: key length, key, type code, value
+    '''
+
+    parts = []
+
+    # Sort the Keys so the Encoding is Deterministic
+    for key in sorted(meta):
+        value = meta[key]
+        parts.append(chr(len(key)) + key)
+
+        # Pack the Value according to its Type (bool before int!)
+        if value is None:
+            parts.append('n')
+        elif isinstance(value, bool):
+            parts.append('t' if value else 'f')
+        elif isinstance(value, (int, long)):
+            parts.append('i' + _INT.pack(value))
+        elif isinstance(value, float):
+            parts.append('d' + _FLOAT.pack(value))
+        elif isinstance(value, unicode):
+            value = value.encode('utf-8')
+            parts.append('u' + _LEN.pack(len(value)) + value)
+        elif isinstance(value, str):
+            parts.append('s' + _LEN.pack(len(value)) + value)
+        else:
+            raise FrameError('Cannot Encode {!r}'.format(value))
+
+    return ''.join(parts)
+
+
+def decodeMeta(data):
+
+    '''
+    Unpacks a Metadata Block created by encodeMeta
+
+      - Returns a Dictionary
+      - Raises FrameError on a truncated or corrupt Block
+    '''
+
+    meta = {}
+    pos = 0
+
+    try:
+        while pos < len(data):
+
+            # Read the Key
+            klen = ord(data[pos])
+            key = data[pos + 1:pos + 1 + klen]
+            pos += 1 + klen
+
+            # Read the Type Code & the Value
+            code = data[pos]
+            pos += 1
+
+            if code == 'n':
+                value = None
+            elif code == 't':
+                value = True
+            elif code == 'f':
+                value = False
+            elif code == 'i':
+                value = _INT.unpack_from(data, pos)[0]
+                pos += _INT.size
+            elif code == 'd':
+                value = _FLOAT.unpack_from(data, pos)[0]
+                pos += _FLOAT.size
+            elif code in 'su':
+                vlen = _LEN.unpack_from(data, pos)[0]
+                pos += _LEN.size
+                value = data[pos:pos + vlen]
+                if len(value) != vlen:
+                    raise FrameError('Truncated Metadata Value')
+                pos += vlen
+                if code == 'u':
+                    value = value.decode('utf-8')
+            else:
+                raise FrameError('Unknown Type Code {!r}'.format(code))
+
+            meta[key] = value
+
+    except (IndexError, struct.error):
+        raise FrameError('Truncated Metadata Block')
+
+    return meta
+
+
+def encodeFrame(msg_type, meta=None, length=0):
+
+    '''
+    Builds a Frame Header & Metadata Block
+
+      - "length" is the size of the Payload that follows
+      - The Payload itself is written separately by the caller
+    '''
+
+    block = encodeMeta(meta or {})
+    if len(block) > 0xffff:
+        raise FrameError('Metadata Block too Large')
+
+    return HEADER.pack(MAGIC, VERSION, msg_type, len(block), length) + block
+
+
+class NukeBoxFrameReceiver(protocol.Protocol):
+
+    '''
+    B{NukeBox 2000 Frame Receiver Class}
+
+      - Length-Prefixed Binary Framing Protocol
+      - Responsible for:
+
+        - Parsing Frame Headers & Metadata Blocks
+        - Delivering Payloads in chunks, completing on the exact byte count
+        - Allowing several Frames to be pipelined on one connection
+        - Holding Frames back while Paused (see pauseFrames)
+
+    Subclasses implement frameReceived, payloadReceived & payloadComplete.
+    '''
+
+    _buffer = ''
+    _remaining = 0
+    _paused = False
+
+    def sendFrame(self, msg_type, meta=None, payload=''):
+
+        '''
+        Writes a complete Frame to the Transport
+        '''
+
+        self.transport.write(encodeFrame(msg_type, meta, len(payload)))
+        if payload:
+            self.transport.write(payload)
+
+    def dataReceived(self, data):
+
+        '''
+        Splits the incoming Stream into Frames
+        '''
+
+        # Join any Partial Header (or Held Data) left over from last call
+        if self._buffer:
+            data = self._buffer + data
+            self._buffer = ''
+
+        pos = 0
+        while pos < len(data):
+
+            # Refused, Nothing more from this Connection Counts
+            if self.transport.disconnecting:
+                return
+
+            # Paused, the Rest Waits for resumeFrames
+            if self._paused:
+                break
+
+            # Inside a Payload, hand over as much as belongs to it
+            if self._remaining:
+                chunk = data[pos:pos + self._remaining]
+                pos += len(chunk)
+                self._remaining -= len(chunk)
+                self.payloadReceived(chunk)
+
+                if not self._remaining:
+                    self.payloadComplete()
+                continue
+
+            # Wait for a Full Header
+            if len(data) - pos < HEADER.size:
+                break
+
+            magic, version, msg_type, meta_len, length = \
+                HEADER.unpack_from(data, pos)
+
+            # Drop the Connection on anything we don't understand
+            if magic != MAGIC or version != VERSION:
+                self.frameError(FrameError('Bad Frame Header'))
+                return
+
+            # Wait for the Full Metadata Block
+            end = pos + HEADER.size + meta_len
+            if len(data) < end:
+                break
+
+            try:
+                meta = decodeMeta(data[pos + HEADER.size:end])
+            except FrameError as err:
+                self.frameError(err)
+                return
+
+            pos = end
+            self._remaining = length
+            self.frameReceived(msg_type, meta, length)
+
+        # Keep any Partial Header for next time
+        self._buffer = data[pos:]
+
+    def pauseFrames(self):
+
+        '''
+        Stops Delivering Frames, e.g. from within frameReceived
+
+          - Whatever Arrives Meanwhile is Held, the Caller should also
+            Stop Reading the Transport so that doesn't Grow
+        '''
+
+        self._paused = True
+
+    def resumeFrames(self):
+
+        '''
+        Delivers the Held Frames & Carries on as Normal
+
+          - Not to be Called from within frameReceived or the Payload
+            Callbacks
+        '''
+
+        self._paused = False
+
+        if self._buffer:
+            data, self._buffer = self._buffer, ''
+            self.dataReceived(data)
+
+    def frameError(self, err):
+
+        '''
+        Called on an undecodable Frame, drops the Connection
+        '''
+
+        print('Frame Error: {}'.format(err))
+        self.transport.loseConnection()
+
+    def frameReceived(self, msg_type, meta, length):
+
+        '''
+        Called with each Frame Header & its decoded Metadata
+
+          - "length" bytes of Payload follow via payloadReceived
+        '''
+
+        raise NotImplementedError
+
+    def payloadReceived(self, data):
+
+        '''
+        Called with each chunk of the current Frame's Payload
+        '''
+
+        raise NotImplementedError
+
+    def payloadComplete(self):
+
+        '''
+        Called once the exact Payload length has been received
+
+          - Never called for Frames without a Payload
+        '''
+
+        raise NotImplementedError
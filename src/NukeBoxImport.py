@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import time
+import argparse
+import functools
+import multiprocessing
+
+from NukeBoxDB import NukeBoxQuery
+from NukeBoxConfig import config
+from NukeBoxIngest import hashFile
+from NukeBoxMeta import readTags, EXTENSIONS
+from NukeBoxLoudness import analyze
+from models import Files
+
+
+# The User Owning Imported Tracks
+HOUSE_NAME = 'House'
+HOUSE_MAC_ID = 'house'
+
+
+def scan(roots):
+
+    '''
+    Yields the Path of every Track below the Given Directories
+
+      - Tracks are Files with the EXTENSIONS we can Store & Play
+
+      - Paths are unicode, as Stored in the DB
+    '''
+
+    encoding = sys.getfilesystemencoding() or 'utf-8'
+
+    for root in roots:
+        for dirpath, dirnames, filenames in os.walk(root):
+
+            # Walk in a Stable Order, so Reruns Match
+            dirnames.sort()
+            for name in sorted(filenames):
+                if os.path.splitext(name)[1].lower() not in EXTENSIONS:
+                    continue
+
+                path = os.path.abspath(os.path.join(dirpath, name))
+                try:
+                    yield path.decode(encoding)
+                except UnicodeDecodeError:
+                    print('Skipping {!r}, Undecodable Name'.format(path))
+
+
+def readTrack(path, target=None):
+
+    '''
+    Reads a Track's Tags & Content Hash, Runs in a Worker Process
+
+      - Returns (path, details, None), or (path, None, reason) if the
+        Track can't be Imported
+      - Like an Upload, Untagged Tracks are Named after their File
+      - Measures the Loudness Gain too, given a "target" (LUFS)
+    '''
+
+    try:
+        details = readTags(path)
+        details.update({'path': path,
+                        'size': os.path.getsize(path),
+                        'hash': hashFile(path)
+                        })
+
+        if target is not None:
+            details['gain'] = analyze(path, target) or 0.0
+
+        return path, details, None
+
+    except Exception as err:
+        return path, None, str(err)
+
+
+class NukeBoxImport(object):
+
+    '''
+    B{NukeBox 2000 Import Class}
+
+      - Bulk Library Import, for Pre-Seeding the Jukebox
+      - Responsible for:
+
+        - Reading Tags & Hashing Tracks in a Pool of Processes
+        - Skipping Paths & Content Already in the DB
+        - Inserting the New Files Rows in Batches (create_many)
+    '''
+
+    def __init__(self, batch=1000, processes=None, target=None):
+
+        '''
+        Import Constructor
+
+          - "processes" Defaults to one per CPU
+          - "target" (LUFS) Measures each Track's Loudness as it is Read,
+            otherwise the Server Measures them when First Played
+        '''
+
+        self.batch = batch
+        self.processes = processes
+        self.target = target
+
+        # Counts for the Summary
+        self.added = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def run(self, roots):
+
+        '''
+        Imports every Track below the Given Directories
+        '''
+
+        start = time.time()
+
+        # Everything Imported Belongs to the House User
+        with NukeBoxQuery() as nbq:
+            house = nbq.create({'Model': 'Users',
+                                'name': HOUSE_NAME,
+                                'mac_id': HOUSE_MAC_ID
+                                })
+
+            # Paths & Content Already Known, Loaded Once up Front
+            known = nbq.session.query(Files.path, Files.hash).all()
+
+        paths = set(path for path, _ in known)
+        hashes = set(digest for _, digest in known)
+
+        found = list(scan(roots))
+        todo = [path for path in found if path not in paths]
+        self.skipped += len(found) - len(todo)
+
+        print('Importing {} Tracks ....'.format(len(todo)))
+
+        pool = multiprocessing.Pool(self.processes)
+        rows = []
+
+        try:
+            read = functools.partial(readTrack, target=self.target)
+            for path, details, reason in pool.imap_unordered(
+                    read, todo, chunksize=16):
+
+                if details is None:
+                    print('Skipping {}: {}'.format(path, reason))
+                    self.failed += 1
+                    continue
+
+                # The same Content is Stored Once
+                if details['hash'] in hashes:
+                    self.skipped += 1
+                    continue
+
+                hashes.add(details['hash'])
+                details['user_id'] = house.user_id
+                rows.append(details)
+
+                if len(rows) >= self.batch:
+                    self.insert(rows)
+                    rows = []
+
+            self.insert(rows)
+
+        finally:
+            pool.terminate()
+            pool.join()
+
+        print('Added {}, Skipped {}, Failed {} in {:.1f} secs'.format(
+            self.added, self.skipped, self.failed, time.time() - start))
+
+    def insert(self, rows):
+
+        '''
+        Inserts a Batch of Files Rows in one Transaction
+        '''
+
+        if not rows:
+            return
+
+        for row in rows:
+            row['Model'] = 'Files'
+
+        with NukeBoxQuery() as nbq:
+            nbq.create_many(rows)
+
+        self.added += len(rows)
+        print('Added {} Tracks'.format(self.added))
+
+
+def main():
+
+    '''
+    Command Line Entry Point
+
+      - NukeBoxImport.py /path/to/music [more dirs ...]
+    '''
+
+    parser = argparse.ArgumentParser(
+        description='Bulk import a music library into the NukeBox DB')
+    parser.add_argument('roots', nargs='+', metavar='DIR',
+                        help='directory to scan for tracks')
+    parser.add_argument('-b', '--batch', type=int, default=1000,
+                        help='rows per commit (default 1000)')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='tag reading processes (default one per CPU)')
+    parser.add_argument('-l', '--loudness', action='store_true',
+                        help='measure loudness too (slower, needs numpy)')
+    args = parser.parse_args()
+
+    for root in args.roots:
+        if not os.path.isdir(root):
+            print('Not a Directory: {}'.format(root))
+            sys.exit(1)
+
+    target = float(config.get('loudness', 'target')) \
+        if args.loudness else None
+
+    NukeBoxImport(args.batch, args.processes, target).run(args.roots)
+
+
+# this only runs if the module was *not* imported
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+
+import os
+import ctypes
+import ctypes.util
+import hashlib
+
+
+# Content Hash used to Address Stored Files, BLAKE2 where Available
+HASH_NAME = 'blake2b' if hasattr(hashlib, 'blake2b') else 'sha256'
+
+
+def libcFallocate():
+
+    '''
+    Returns posix_fallocate from the C Library (Python 2's os has None),
+    or None where there's no Such Call
+
+      - Like os.posix_fallocate, Raises OSError if it Fails
+    '''
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'))
+        call = getattr(libc, 'posix_fallocate64', None) or \
+            libc.posix_fallocate
+    except (OSError, AttributeError):
+        return None
+
+    call.argtypes = [ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+
+    def fallocate(fd, offset, length):
+        # Returns the Error Number rather than Setting errno
+        err = call(fd, offset, length)
+        if err:
+            raise OSError(err, os.strerror(err))
+
+    return fallocate
+
+
+# Reserves Disk Space for a File, Python 3's os or the C Library's
+fallocate = getattr(os, 'posix_fallocate', None) or libcFallocate()
+
+
+def newHash():
+
+    '''
+    Returns a Fresh Content Hash Object
+    '''
+
+    if HASH_NAME == 'blake2b':
+        return hashlib.blake2b(digest_size=32)
+    return hashlib.new(HASH_NAME)
+
+
+def formatDigest(h):
+
+    '''
+    Returns the Digest String stored in the DB, e.g. "sha256:ab12..."
+
+      - The Algorithm is Included so Mismatched Peers never Collide
+    '''
+
+    return HASH_NAME + ':' + h.hexdigest()
+
+
+def hashFile(path, chunk_size=65536):
+
+    '''
+    Computes the Content Digest of a File on Disk in Chunks
+    '''
+
+    h = newHash()
+
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), ''):
+            h.update(chunk)
+
+    return formatDigest(h)
+
+
+class NukeBoxIngest(object):
+
+    '''
+    B{NukeBox 2000 Ingest Class}
+
+      - NukeBox Streaming Ingest Object
+      - Responsible for:
+
+        - Writing received File data straight to the Temp File
+        - Bounding the amount of data held in memory (write-behind)
+        - Preallocating disk space for the announced File size
+        - Hashing the Content as it Streams in
+        - Committing verified Chunks & Rewinding unverified ones
+    '''
+
+    def __init__(self, path, size, buffer_size=65536, preallocate=True,
+                 offset=0):
+
+        '''
+        Ingest Constructor
+
+          - Opens the Temp File for writing
+          - Resumes a Partial Temp File when "offset" is given
+          - Preallocates "size" bytes where the platform supports it
+        '''
+
+        # Create the Instance Variables
+        self.path = path
+        self.size = size
+        self.buffer_size = buffer_size
+
+        # Bytes Received so far & the Pending Write-Behind Chunks
+        self.received = offset
+        self.chunks = []
+        self.buffered = 0
+
+        # Bytes Verified & Safely Written, Rewinds go back to here
+        self.committed = offset
+
+        # Set once the Whole File's Space is Reserved
+        self.preallocated = False
+
+        # Open the Temp File unbuffered, the Chunk list is our only buffer
+        if offset:
+
+            # Keep the Committed Data, Drop anything Unverified after it
+            self.f = open(self.path, 'r+b', 0)
+            self.f.truncate(offset)
+            self.f.seek(offset)
+
+            # The Stream Hash can't cover what Arrived Before, see digest
+            self.hash = None
+
+        else:
+            self.f = open(self.path, 'wb', 0)
+
+            # Content Hash, Updated as each Chunk Arrives
+            self.hash = newHash()
+
+        self.committed_hash = self.hash and self.hash.copy()
+
+        # Reserve the Space up front so the File is not fragmented
+        if preallocate and self.size > 0:
+            self.preallocate()
+
+    def preallocate(self):
+
+        '''
+        Preallocates the Temp File
+
+          - Uses posix_fallocate (os's or the C Library's) when available
+          - Failure is not fatal, the File simply grows as written
+        '''
+
+        # Only Available on some Platforms
+        if fallocate is None:
+            return False
+
+        try:
+            fallocate(self.f.fileno(), 0, self.size)
+            self.preallocated = True
+            return True
+
+        except OSError as err:
+            print('Preallocation Failed: {}'.format(err))
+            return False
+
+    def allocated(self):
+
+        '''
+        Returns the Bytes the Temp File Takes on the Disk, All of them
+        once Preallocated
+        '''
+
+        return self.size if self.preallocated else self.received
+
+    def write(self, data):
+
+        '''
+        Ingest Write Method
+
+          - Queues the data in the Write-Behind buffer
+          - Flushes to disk once the buffer limit is reached
+        '''
+
+        # Track the Chunk, the Hash & the Totals
+        if self.hash is not None:
+            self.hash.update(data)
+        self.chunks.append(data)
+        self.buffered += len(data)
+        self.received += len(data)
+
+        # If the Buffer is Full, Write it Out
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+
+        '''
+        Writes any buffered Chunks to the Temp File
+        '''
+
+        if self.chunks:
+            self.f.write(''.join(self.chunks))
+            self.chunks = []
+            self.buffered = 0
+
+    def commit(self):
+
+        '''
+        Marks Everything Received so far as Verified
+
+          - Flushes the Buffer so the Committed Data is on Disk
+          - Returns the New Committed Offset
+        '''
+
+        self.flush()
+        self.committed = self.received
+        self.committed_hash = self.hash and self.hash.copy()
+        return self.committed
+
+    def rewind(self):
+
+        '''
+        Discards Everything Received since the Last Commit
+        '''
+
+        # Drop the Pending Data & Cut the File back to the Commit Point
+        self.chunks = []
+        self.buffered = 0
+        self.f.truncate(self.committed)
+        self.f.seek(self.committed)
+
+        # The Truncate Gave the Reserved Space back, Take it Again
+        if self.preallocated:
+            self.preallocate()
+
+        # Restore the Totals & the Hash to Match
+        self.received = self.committed
+        self.hash = self.committed_hash and self.committed_hash.copy()
+
+    def digest(self):
+
+        '''
+        Returns the Content Digest String of the Data Received so far
+
+          - Returns None for a Resumed Transfer, hash the File instead
+        '''
+
+        if self.hash is None:
+            return None
+        return formatDigest(self.hash)
+
+    def close(self):
+
+        '''
+        Flushes & Closes the Temp File
+        '''
+
+        if not self.f.closed:
+            self.flush()
+            self.f.close()
+
+    def abort(self):
+
+        '''
+        Abandons the Transfer
+
+          - Closes & Removes the Temp File
+        '''
+
+        # Drop any Pending Data & Close the File
+        self.chunks = []
+        self.buffered = 0
+        self.f.close()
+
+        # Remove the Partial Temp File
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+
+
+class NukeBoxIndex(object):
+
+    '''
+    B{NukeBox 2000 Offset Index Class}
+
+      - Sidecar to a Partial Upload in the Temp Directory
+      - Responsible for:
+
+        - Recording each Committed Chunk (End Offset & Checksum)
+        - Reporting the Committed Offset when a Client Resumes
+    '''
+
+    def __init__(self, path):
+
+        '''
+        Index Constructor
+
+          - Loads any Chunks Recorded by an Earlier Session
+        '''
+
+        self.path = path
+        self.chunks = []
+
+        # A Torn Last Line (e.g. after a Crash) is Simply Ignored
+        if os.path.isfile(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        end, crc = line.split()
+                        self.chunks.append((int(end), int(crc)))
+                    except ValueError:
+                        break
+
+    def committed(self):
+
+        '''
+        Returns the Offset up to which the Partial Upload is Verified
+        '''
+
+        if self.chunks:
+            return self.chunks[-1][0]
+        return 0
+
+    def append(self, end, crc):
+
+        '''
+        Records a Newly Committed Chunk
+        '''
+
+        self.chunks.append((end, crc))
+        with open(self.path, 'a') as f:
+            f.write('{} {}\n'.format(end, crc))
+
+    def remove(self):
+
+        '''
+        Deletes the Index once the Upload is Complete
+        '''
+
+        self.chunks = []
+        if os.path.isfile(self.path):
+            os.remove(self.path)
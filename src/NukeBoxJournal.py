@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+
+import os
+import time
+import threading
+from ast import literal_eval
+
+
+class NukeBoxJournal(object):
+
+    '''
+    B{NukeBox 2000 Journal Class}
+
+      - Append-Only Write-Ahead Log behind the NukeBoxQueue
+      - Responsible for:
+
+        - Recording every Append ('A') & Pop ('P') as one Line
+        - Batching fsync Calls (every "batch" Records or "interval" secs)
+        - Replaying the Records after a Restart
+        - Compacting the Log down to a Snapshot of the Queue
+
+    Each Record is Flushed to the OS as it is Written, so a Crash of the
+    Server Loses Nothing; only a Power Cut can Lose the Unsynced Batch.
+    The fsyncs & Compaction Run in a Thread of their own, so Logging never
+    Waits on the Disk. Entries are Written as Python Literals (repr), so
+    one Holding a Newline or Tab (e.g. from a Client's mac_id) is still
+    one Line.
+    '''
+
+    def __init__(self, path, batch=32, interval=0.5):
+
+        '''
+        Journal Constructor
+
+          - Opens (or Creates) the Log for Appending
+        '''
+
+        self.path = path
+        self.batch = batch
+        self.interval = interval
+
+        # Records in the Log, & those Written since the Last fsync
+        self.records = 0
+        self.unsynced = 0
+
+        self.f = open(self.path, 'a')
+
+        # Guards the Log, Wakes the Sync Thread when Records Arrive
+        self.cond = threading.Condition()
+        self.closing = False
+
+        # A Snapshot Waiting to be Written by the Sync Thread (& where the
+        # Log had Got to when it was Taken), Set until it is Swapped in
+        self.snapshot = None
+        self.compacting = False
+
+        self.syncer = threading.Thread(target=self.syncLoop)
+        self.syncer.daemon = True
+        self.syncer.start()
+
+    def replay(self):
+
+        '''
+        Returns the Logged Records as a List of (op, entry) Tuples
+
+          - A Torn Last Line (Crash Mid-Write) is Ignored
+          - Lines that aren't Records are Skipped, not Fatal
+        '''
+
+        records = []
+
+        with open(self.path) as f:
+            for line in f:
+
+                # Only Complete Lines were Fully Written
+                if not line.endswith('\n'):
+                    break
+
+                try:
+                    op, entry = line[:-1].split('\t', 1)
+                    entry = literal_eval(entry)
+                    if op not in ('A', 'P') or \
+                            not isinstance(entry, basestring):
+                        raise ValueError(op)
+
+                except (ValueError, SyntaxError):
+                    print('Skipping Bad Journal Record {!r}'.format(line))
+                    continue
+
+                records.append((op, entry))
+
+        self.records = len(records)
+        return records
+
+    def log(self, op, entry):
+
+        '''
+        Appends a Record, the Sync Thread fsyncs it once the Batch is Full
+        or Stale
+        '''
+
+        with self.cond:
+            self.f.write('{}\t{!r}\n'.format(op, entry))
+            self.f.flush()
+            self.records += 1
+            self.unsynced += 1
+            self.cond.notify()
+
+    def syncLoop(self):
+
+        '''
+        Sync Thread, fsyncs a Batch once it is Full, or "interval" secs
+        after its First Record, & Writes Snapshots, until the Journal is
+        Closed
+        '''
+
+        while True:
+            with self.cond:
+
+                # Sleep until Something is Logged (or to be Compacted)
+                while not self.unsynced and self.snapshot is None and \
+                        not self.closing:
+                    self.cond.wait()
+
+                # Give the Batch a While to Fill, a Snapshot goes Now
+                deadline = time.time() + self.interval
+                while self.unsynced < self.batch and \
+                        self.snapshot is None and not self.closing:
+                    timeout = deadline - time.time()
+                    if timeout <= 0:
+                        break
+                    self.cond.wait(timeout)
+
+                # Close Syncs what's Left Itself
+                if self.closing:
+                    return
+
+                # Sync a Copy of the Descriptor, so Logging Carries on
+                fd = os.dup(self.f.fileno()) if self.unsynced else None
+                self.unsynced = 0
+
+                snapshot, self.snapshot = self.snapshot, None
+
+            if fd is not None:
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+
+            if snapshot is not None:
+                self.rewrite(*snapshot)
+
+    def sync(self):
+
+        '''
+        Forces the Logged Records onto the Disk, Now
+        '''
+
+        with self.cond:
+            if self.unsynced:
+                os.fsync(self.f.fileno())
+                self.unsynced = 0
+
+    def compact(self, entries):
+
+        '''
+        Replaces the Log with one Append per Entry Still Queued
+
+          - "entries" is the Queue as of the Last Record Logged
+          - Only Hands the Snapshot to the Sync Thread, so the Caller never
+            Waits on the Disk (see rewrite)
+          - Ignored while an Earlier Compaction is still Under Way
+        '''
+
+        with self.cond:
+            if self.compacting:
+                return
+
+            self.compacting = True
+            self.snapshot = (list(entries), self.f.tell())
+            self.cond.notify()
+
+    def rewrite(self, entries, mark):
+
+        '''
+        Writes a Snapshot & Swaps it in for the Log, on the Sync Thread
+
+          - Written to a Temp File & Renamed, so a Crash Leaves Either
+            the Old Log or the New one, Never Half of Each
+          - Records Logged after "mark" (Meanwhile) are Carried over, &
+            Synced with the Next Batch
+        '''
+
+        tmp = self.path + '.tmp'
+
+        with open(tmp, 'w') as f:
+            for entry in entries:
+                f.write('A\t{!r}\n'.format(entry))
+            f.flush()
+            os.fsync(f.fileno())
+
+        with self.cond:
+            with open(self.path) as f:
+                f.seek(mark)
+                tail = f.read()
+
+            with open(tmp, 'a') as f:
+                f.write(tail)
+
+            self.f.close()
+            os.rename(tmp, self.path)
+            self.f = open(self.path, 'a')
+
+            self.records = len(entries) + tail.count('\n')
+            self.unsynced = tail.count('\n')
+            self.compacting = False
+
+    def close(self):
+
+        '''
+        Stops the Sync Thread, then Syncs & Closes the Log
+        '''
+
+        with self.cond:
+            self.closing = True
+            self.cond.notify()
+
+        self.syncer.join()
+
+        if not self.f.closed:
+            self.sync()
+            self.f.close()
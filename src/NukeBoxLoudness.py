@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import math
+import subprocess
+
+from twisted.internet import defer
+from twisted.internet.utils import getProcessOutputAndValue
+
+from NukeBoxConfig import config
+
+
+# Analysis Format, 48kHz is what BS.1770 Specifies the Filters for
+RATE = 48000
+CHANNELS = 2
+
+# Loudness is Measured over 400ms Blocks, Overlapping by 75%, so
+# Energies are Summed over 100ms Steps & Combined 4 at a Time
+STEP = RATE // 10
+
+# Samples Decoded & Analysed at a Time (10 secs), Bounds the Memory Used
+READ = STEP * 100
+
+# Gates, Silence & Quiet Passages don't Count (EBU R128)
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+# Gains are Rounded to this many dB
+PRECISION = 2
+
+# This File, Run in the Child Processes (the Source, not the .pyc)
+SCRIPT = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+
+
+def loudness(energy):
+
+    '''
+    Returns the Loudness (LUFS / LKFS) of a Mean Square Energy
+    '''
+
+    return -0.691 + 10 * math.log10(energy) if energy > 0 else float('-inf')
+
+
+def kWeighting(rate):
+
+    '''
+    Returns the (b, a) Coefficients of the two BS.1770 K-Weighting Stages
+
+      - A High Shelf (the Head) then a High Pass (RLB), for any Rate
+      - At 48kHz these are the Coefficients the Standard Lists
+    '''
+
+    # High Shelf, +4dB above ~1.7kHz
+    gain, q, freq = 3.999843853973347, 0.7071752369554196, 1681.974450955533
+    K = math.tan(math.pi * freq / rate)
+    Vh = 10 ** (gain / 20.0)
+    Vb = Vh ** 0.4996667741545416
+    a0 = 1 + K / q + K * K
+
+    shelf = ([(Vh + Vb * K / q + K * K) / a0,
+              2 * (K * K - Vh) / a0,
+              (Vh - Vb * K / q + K * K) / a0],
+             [1.0, 2 * (K * K - 1) / a0, (1 - K / q + K * K) / a0])
+
+    # High Pass, Rolling off below ~38Hz
+    q, freq = 0.5003270373238773, 38.13547087602444
+    K = math.tan(math.pi * freq / rate)
+    a0 = 1 + K / q + K * K
+
+    highpass = ([1.0, -2.0, 1.0],
+                [1.0, 2 * (K * K - 1) / a0, (1 - K / q + K * K) / a0])
+
+    return shelf, highpass
+
+
+def analyze(path, target=-18.0):
+
+    '''
+    Measures a Track's Integrated Loudness & Returns the Gain in dB to
+    Bring it to the Target, Runs in a Child or Worker Process
+
+      - Decodes with ffmpeg to 48kHz Stereo Float, 10 secs at a Time
+      - K-Weights with scipy, if it is Installed, otherwise the
+        Unweighted Energy is Used (Close, but Bass Heavy Tracks Measure
+        a little Loud)
+      - Gates as EBU R128 / BS.1770 does
+      - The Gain never Lifts the Peak Sample above Full Scale
+      - Returns None for Silence (or a Track too Short to Measure)
+    '''
+
+    # Imported Here, so the Server Runs (without Analysis) without them
+    import numpy
+
+    try:
+        from scipy.signal import lfilter
+    except ImportError:
+        lfilter = None
+
+    proc = subprocess.Popen(['ffmpeg', '-nostdin', '-v', 'error',
+                             '-i', path,
+                             '-f', 'f32le',
+                             '-ar', str(RATE),
+                             '-ac', str(CHANNELS),
+                             'pipe:1'],
+                            stdout=subprocess.PIPE)
+
+    # Filter State, Carried from one Read to the Next
+    stages = kWeighting(RATE) if lfilter else []
+    states = [numpy.zeros((2, CHANNELS)) for _ in stages]
+
+    frame = CHANNELS * 4
+    energies = []
+    peak = 0.0
+    carry = numpy.zeros((0, CHANNELS))
+    partial = ''
+
+    try:
+        while True:
+            data = proc.stdout.read(READ * frame)
+            if not data:
+                break
+
+            # Whole Frames only, a Read may End Part Way through one
+            data = partial + data
+            whole = len(data) - len(data) % frame
+            data, partial = data[:whole], data[whole:]
+
+            x = numpy.frombuffer(data, '<f4').reshape(-1, CHANNELS)
+            x = x.astype(numpy.float64)
+            peak = max(peak, float(numpy.abs(x).max()) if len(x) else 0.0)
+
+            for n, (b, a) in enumerate(stages):
+                x, states[n] = lfilter(b, a, x, axis=0, zi=states[n])
+
+            # Mean Square per 100ms Step, Summed over the Channels
+            x = numpy.concatenate((carry, x))
+            steps = len(x) // STEP
+            carry = x[steps * STEP:]
+
+            squares = (x[:steps * STEP] ** 2).reshape(steps, STEP, CHANNELS)
+            energies.append(squares.mean(axis=1).sum(axis=1))
+
+    finally:
+        proc.stdout.close()
+        if proc.wait() != 0:
+            raise RuntimeError('ffmpeg could not Decode ' + path)
+
+    steps = numpy.concatenate(energies) if energies else numpy.zeros(0)
+    if len(steps) < 4:
+        return None
+
+    # 400ms Blocks, each the Mean of 4 Steps
+    blocks = (steps[:-3] + steps[1:-2] + steps[2:-1] + steps[3:]) / 4
+
+    # Drop Silence, then anything 10 LU below the Rest
+    with numpy.errstate(divide='ignore'):
+        levels = -0.691 + 10 * numpy.log10(blocks)
+
+    gated = blocks[levels > ABSOLUTE_GATE]
+    if not len(gated):
+        return None
+
+    threshold = loudness(gated.mean()) + RELATIVE_GATE
+    gated = blocks[levels > max(threshold, ABSOLUTE_GATE)]
+
+    gain = target - loudness(gated.mean())
+
+    # Never Clip, Quiet Tracks are only Lifted as far as their Peak Allows
+    if peak > 0:
+        gain = min(gain, -20 * math.log10(peak))
+
+    return round(gain, PRECISION)
+
+
+class NukeBoxLoudness(object):
+
+    '''
+    B{NukeBox 2000 Loudness Class}
+
+      - Loudness Analysis for the Server, in Child Processes
+      - Responsible for:
+
+        - Measuring Tracks off the Reactor & out of its Process (the
+          Analysis is CPU Bound, Threads would Hold the GIL)
+        - Running at most "processes" Analyses at a Time
+        - Handing the Gain back in a Deferred
+
+    Each Analysis is a Fresh Process, Spawned by the Reactor, so Nothing
+    the Server has Open (Sockets, Threads) is Copied into it.
+
+    Analysis Needs numpy (& scipy for K-Weighting, see analyze), Installed
+    for the Python the Server Runs on. Without numpy every Analysis Fails
+    & Tracks Play at their Own Level.
+
+    B{Syntax}
+
+      >>> loudness = NukeBoxLoudness()
+      >>> d = loudness.analyze('/path/to/track.mp3')
+      >>> d.addCallback(storeGain)
+    '''
+
+    def __init__(self, processes=None, target=None):
+
+        '''
+        Loudness Constructor
+
+          - Defaults to the [loudness] Settings in the Config
+        '''
+
+        self.processes = processes or config.getint('loudness', 'processes')
+        self.target = target if target is not None else \
+            float(config.get('loudness', 'target'))
+
+        # Analyses Wait their Turn for one of the Processes
+        self.slots = defer.DeferredSemaphore(self.processes)
+
+    def analyze(self, path):
+
+        '''
+        Returns a Deferred Firing with the Gain for a Track, see analyze
+        '''
+
+        return self.slots.run(self.spawn, path)
+
+    def spawn(self, path):
+
+        '''
+        Runs this Module on one Track, in a Child Process
+        '''
+
+        d = getProcessOutputAndValue(sys.executable,
+                                     [SCRIPT, path, str(self.target)],
+                                     env=os.environ)
+        d.addCallback(self.parse, path)
+        return d
+
+    def parse(self, result, path):
+
+        '''
+        Turns the Child's Output into the Gain, or a Failure
+        '''
+
+        out, err, code = result
+
+        if code != 0:
+            lines = err.strip().splitlines() or ['Exit Code {}'.format(code)]
+            raise RuntimeError(lines[-1])
+
+        out = out.strip()
+        return None if out == 'None' else float(out)
+
+
+def main():
+
+    '''
+    Child Process Entry Point
+
+      - NukeBoxLoudness.py /path/to/track.mp3 [target]
+      - Prints the Gain, or None
+    '''
+
+    target = float(sys.argv[2]) if sys.argv[2:] else \
+        float(config.get('loudness', 'target'))
+
+    print(analyze(sys.argv[1], target))
+
+
+# this only runs if the module was *not* imported
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,565 @@
+#!/usr/bin/env python
+
+import os
+import re
+import wave
+import struct
+
+from mutagen.mp3 import MP3
+from mutagen.mp4 import MP4
+from mutagen.flac import FLAC
+from mutagen.oggopus import OggOpus
+from mutagen.oggvorbis import OggVorbis
+
+
+# Bytes Needed to Tell the Formats Apart
+HEAD = 64
+
+# ID3v2 Tag Header - 'ID3', Version, Revision, Flags, Syncsafe Size
+ID3_HEADER = struct.Struct('!3sBBB4s')
+
+# Bytes after any Tag Searched for the First MPEG Audio Frame
+WINDOW = 4096
+
+# Longest MPEG Audio Frame (MPEG 2.5 Layer II, 160kbps at 8kHz), a Frame
+# Starting Anywhere in the Window is Checked against the Header after it
+FRAME_MAX = 144 * 160000 // 8000 + 1
+SPAN = WINDOW + FRAME_MAX + 4
+
+# Bit Rates in kbps, by (MPEG 1?, Layer) & Bit Rate Index (0 is 'Free')
+BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352,
+                384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256,
+                320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224,
+                256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192,
+                 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144,
+                 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144,
+                 160),
+}
+
+# Sample Rates in Hz, by Version Bits (MPEG 2.5, -, MPEG 2, MPEG 1)
+SAMPLE_RATES = {0: (11025, 12000, 8000),
+                2: (22050, 24000, 16000),
+                3: (44100, 48000, 32000)
+                }
+
+# MP4 Major Brands, the Audio ones & the Generic ones (which may Hold
+# Video, see readMp4)
+MP4_AUDIO_BRANDS = ('M4A ', 'M4B ', 'M4P ', 'F4A ', 'F4B ')
+MP4_BRANDS = MP4_AUDIO_BRANDS + ('isom', 'iso2', 'mp41', 'mp42', 'dash')
+
+# MP4 Box Header - Size, Type (a Size of 1 means a 64 bit Size Follows)
+BOX = struct.Struct('!I4s')
+LARGE_SIZE = struct.Struct('!Q')
+
+# Tag Keys for the Artist, Title, Album & Genre
+ID3_KEYS = ('TPE1', 'TIT2', 'TALB', 'TCON')
+VORBIS_KEYS = ('artist', 'title', 'album', 'genre')
+MP4_KEYS = ('\xa9ART', '\xa9nam', '\xa9alb', '\xa9gen')
+
+# Untagged Tracks are Named after their File, 'Artist - Title.ext'
+UNKNOWN_ARTIST = u'Unknown Artist'
+TRACK_NUMBER = re.compile(r'^\d+[\s._-]+', re.UNICODE)
+
+
+class MetaError(Exception):
+
+    '''
+    Raised when an Upload is not Audio, or its Tags can't be Used
+    '''
+
+
+def sniffFormat(head):
+
+    '''
+    Returns the Extension of the Format the First HEAD Bytes Announce
+
+      - FLAC, Ogg (Vorbis or Opus), MP4 & WAV Start with Magic Bytes
+      - Returns None for Anything Else, it may be MP3 (which has none)
+      - Raises MetaError for a Container Holding something we can't Play
+    '''
+
+    if head.startswith('fLaC'):
+        return '.flac'
+
+    # The First Ogg Page Holds the Codec's Header Packet
+    if head.startswith('OggS'):
+        packet = head[27 + ord(head[26]):]
+        if packet.startswith('\x01vorbis'):
+            return '.ogg'
+        if packet.startswith('OpusHead'):
+            return '.opus'
+        raise MetaError('Unsupported Ogg Codec')
+
+    # Not Films, Phone Videos (3GP, QuickTime) or HEIC / AVIF Images
+    if head[4:8] == 'ftyp':
+        if head[8:12] in MP4_BRANDS:
+            return '.m4a'
+        raise MetaError('Unsupported MP4 Brand')
+
+    if head.startswith('RIFF'):
+        if head[8:12] == 'WAVE':
+            return '.wav'
+        raise MetaError('Unsupported RIFF Format')
+
+    return None
+
+
+def frameLength(header):
+
+    '''
+    Returns the Length of the MPEG Audio Frame a 4 Byte Header Starts
+
+      - Returns None if it is not a Valid Frame Header
+    '''
+
+    if len(header) < 4 or header[0] != '\xff':
+        return None
+
+    b1, b2 = ord(header[1]), ord(header[2])
+
+    # 11 Sync Bits, then Version & Layer (01 is Reserved for both)
+    version = (b1 >> 3) & 3
+    layer = 4 - ((b1 >> 1) & 3)
+    if b1 & 0xe0 != 0xe0 or version == 1 or layer == 4:
+        return None
+
+    # 'Free' & 'Bad' Bit Rates, & the Reserved Sample Rate
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 3
+    if bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    mpeg1 = version == 3
+    bitrate = BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    rate = SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 1
+
+    if layer == 1:
+        return (12 * bitrate // rate + padding) * 4
+    if layer == 3 and not mpeg1:
+        return 72 * bitrate // rate + padding
+    return 144 * bitrate // rate + padding
+
+
+def sameStream(header, following):
+
+    '''
+    Returns True if "following" is a Valid Frame Header of the Same
+    Version, Layer & Sample Rate as "header"
+    '''
+
+    return bool(frameLength(following)) and \
+        ord(header[1]) & 0xfe == ord(following[1]) & 0xfe and \
+        ord(header[2]) & 0x0c == ord(following[2]) & 0x0c
+
+
+def tagEnd(header):
+
+    '''
+    Returns where the Audio Starts, given the First 10 Bytes of a File
+
+      - After the ID3v2 Tag (& its Footer) if there is one, else 0
+      - Raises MetaError for a Damaged Tag Header
+    '''
+
+    magic, major, revision, flags, size = ID3_HEADER.unpack(header)
+    if magic != 'ID3':
+        return 0
+
+    # Versions 2.2 to 2.4, with a Syncsafe (7 Bits per Byte) Size
+    if major not in (2, 3, 4) or revision == 0xff or \
+            any(ord(c) & 0x80 for c in size):
+        raise MetaError('Damaged ID3 Tag')
+
+    length = 0
+    for c in size:
+        length = (length << 7) | ord(c)
+
+    footer = ID3_HEADER.size if flags & 0x10 else 0
+    return ID3_HEADER.size + length + footer
+
+
+class NukeBoxSniffer(object):
+
+    '''
+    B{NukeBox 2000 Sniffer Class}
+
+      - Checks an Upload is Audio from its First Bytes
+      - Responsible for:
+
+        - Recognising Formats by their Magic Bytes, see sniffFormat
+        - Otherwise Skipping any ID3v2 Tag, by the Size in its Header,
+          & Finding two MPEG Audio Frames in a Row in the WINDOW after it
+        - Raising MetaError as Soon as the Data can't be Audio
+
+    Only the Head & the Window (plus the Longest Frame, so the Header
+    after a Frame near its End can be Checked) are Kept, whatever the Tag
+    Size, so Uploads can be Fed through it Chunk by Chunk as they Arrive.
+    Once done, "format" is the Extension the File should be Stored with.
+
+    B{Syntax}
+
+      >>> sniffer = NukeBoxSniffer()
+      >>> sniffer.feed(chunk)     # True once it Looks like Audio
+      >>> sniffer.finish()        # At the End, Decides on what Arrived
+    '''
+
+    def __init__(self):
+
+        '''
+        Sniffer Constructor
+        '''
+
+        # Set once the Upload Looks like Audio, & its Extension
+        self.done = False
+        self.format = None
+
+        # Bytes Fed so far, & those Held until the Tag Header is Read
+        self.seen = 0
+        self.pending = ''
+
+        # Where the Audio Starts & the Bytes Searched for a Frame there
+        self.start = None
+        self.window = ''
+
+    def clip(self, pos, data):
+
+        '''
+        Returns the Part of "data" (from "pos" in the Upload) the Sniffer
+        could still Use, & where that Starts, so only it need be Held
+
+          - All of it until the Head has been Read, it Says where to Look
+        '''
+
+        if self.done:
+            return pos, ''
+
+        if self.start is None:
+            return pos, data
+
+        low = max(self.start, pos)
+        high = min(self.start + SPAN, pos + len(data))
+        return low, data[low - pos:max(low, high) - pos]
+
+    def feed(self, data, pos=None):
+
+        '''
+        Sniffs the Next Bytes of the Upload
+
+          - "pos" is where they Start, by Default Straight after the Last,
+            Bytes Skipped Over must be ones clip Drops
+          - Returns True once it Looks like Audio, False while Undecided
+          - Raises MetaError if it is Not Audio
+        '''
+
+        if self.done:
+            return True
+
+        # Read the Head First, it Says what Format it is or where to Look
+        if self.start is None:
+            self.pending += data
+            if len(self.pending) < HEAD:
+                return False
+
+            self.format = sniffFormat(self.pending[:HEAD])
+            if self.format is not None:
+                self.done = True
+                return True
+
+            self.start = tagEnd(self.pending[:ID3_HEADER.size])
+            data, self.pending, pos = self.pending, '', 0
+
+        # Keep just the Part of the Data Inside the Window
+        if pos is None:
+            pos = self.seen
+        self.seen = max(self.seen, pos + len(data))
+
+        low = max(self.start, pos)
+        high = min(self.start + SPAN, self.seen)
+        if low < high:
+            self.window += data[low - pos:high - pos]
+
+        if len(self.window) >= SPAN:
+            self.decide()
+
+        return self.done
+
+    def feedFile(self, path, limit):
+
+        '''
+        Sniffs the First "limit" Bytes of a File, e.g. a Resumed Upload
+        '''
+
+        with open(path, 'rb') as f:
+            while not self.done and limit > 0:
+                data = f.read(min(65536, limit))
+                if not data:
+                    break
+                limit -= len(data)
+                self.feed(data)
+
+        return self.done
+
+    def finish(self):
+
+        '''
+        Decides on what Arrived, once the Whole Upload Has
+
+          - Raises MetaError if it is Not Audio
+        '''
+
+        if self.done:
+            return
+
+        if self.start is None:
+            raise MetaError('Too Short to be Audio')
+
+        self.decide(final=True)
+
+    def decide(self, final=False):
+
+        '''
+        Searches the Window for an MPEG Audio Frame
+
+          - A Frame Counts if the Next one, of the Same Stream, Follows
+            Straight after it
+          - Or, once the Whole File has Arrived, if it Runs to the End
+        '''
+
+        window = self.window
+
+        # Some FLAC Files Carry an ID3 Tag too
+        if window.startswith('fLaC'):
+            self.format = '.flac'
+            self.done = True
+            return
+
+        at = window.find('\xff')
+
+        while at != -1 and at < WINDOW:
+            header = window[at:at + 4]
+            length = frameLength(header)
+            if length:
+                following = window[at + length:at + length + 4]
+
+                # Or there's Nothing to Check it Against
+                if (len(following) == 4 and
+                        sameStream(header, following)) or \
+                        (len(following) < 4 and final):
+                    self.format = '.mp3'
+                    self.done = True
+                    return
+
+            at = window.find('\xff', at + 1)
+
+        raise MetaError('Unsupported Format')
+
+
+def textOf(value):
+
+    '''
+    Returns the First Text of a Tag Value, None if it is Empty
+
+      - ID3 Frames Hold it in .text (Genres in .genres, which Turns
+        Numeric ID3v1 Genres, e.g. '(17)', into Names)
+      - Vorbis Comments & MP4 Atoms are Lists
+    '''
+
+    if hasattr(value, 'genres'):
+        values = value.genres
+    elif hasattr(value, 'text'):
+        values = value.text
+    else:
+        values = value
+
+    return unicode(values[0]) if values else None
+
+
+def readMutagen(kind, keys):
+
+    '''
+    Returns a Reader for one Format, using its mutagen Class Directly
+    '''
+
+    def read(path):
+        audio = kind(path)
+        tags = audio.tags or {}
+
+        found = [textOf(tags[key]) if key in tags else None for key in keys]
+        return dict(zip(('artist', 'title', 'album', 'genre'), found)), \
+            audio.info.length
+
+    return read
+
+
+def findBoxes(f, start, end, path):
+
+    '''
+    Yields the (start, end) of the Contents of every MP4 Box Nested at
+    "path" (e.g. ('moov', 'trak')) between "start" & "end" of a File
+
+      - Raises MetaError for a Box Running Past its Parent
+    '''
+
+    pos = start
+
+    while pos + BOX.size <= end:
+        f.seek(pos)
+        size, kind = BOX.unpack(f.read(BOX.size))
+        body = pos + BOX.size
+
+        if size == 1:
+            size, = LARGE_SIZE.unpack(f.read(LARGE_SIZE.size))
+            body += LARGE_SIZE.size
+        elif size == 0:
+            size = end - pos
+
+        if size < body - pos or pos + size > end:
+            raise MetaError('Damaged MP4 Box')
+
+        if kind == path[0]:
+            if len(path) == 1:
+                yield body, pos + size
+            else:
+                for found in findBoxes(f, body, pos + size, path[1:]):
+                    yield found
+
+        pos += size
+
+
+def readMp4(path):
+
+    '''
+    Reads an MP4's Tags & Length, Refusing any that Hold Video
+
+      - Generic Brands are Films as often as Music, the Tracks' Handlers
+        Tell them Apart ('soun' for Audio, 'vide' for Video)
+    '''
+
+    handlers = []
+
+    with open(path, 'rb') as f:
+        end = os.fstat(f.fileno()).st_size
+        handler = ('moov', 'trak', 'mdia', 'hdlr')
+        for body, _ in findBoxes(f, 0, end, handler):
+
+            # After the Version, Flags & a Reserved Word
+            f.seek(body + 8)
+            handlers.append(f.read(4))
+
+    if 'vide' in handlers:
+        raise MetaError('MP4 Holds Video')
+    if 'soun' not in handlers:
+        raise MetaError('MP4 Holds no Audio')
+
+    return readMutagen(MP4, MP4_KEYS)(path)
+
+
+def readWave(path):
+
+    '''
+    Reads the Length of a WAV, they Rarely have Tags
+
+      - The Standard Library's wave, mutagen (on Python 2) has no WAV
+    '''
+
+    audio = wave.open(path, 'rb')
+    try:
+        return {}, audio.getnframes() / float(audio.getframerate())
+    finally:
+        audio.close()
+
+
+# Tag Readers, by Extension
+READERS = {'.mp3': readMutagen(MP3, ID3_KEYS),
+           '.flac': readMutagen(FLAC, VORBIS_KEYS),
+           '.ogg': readMutagen(OggVorbis, VORBIS_KEYS),
+           '.opus': readMutagen(OggOpus, VORBIS_KEYS),
+           '.m4a': readMp4,
+           '.wav': readWave
+           }
+
+# Extensions of the Formats we can Store & Play
+EXTENSIONS = tuple(sorted(READERS))
+
+
+def sniffFile(path):
+
+    '''
+    Returns the Extension of a File's Format, see NukeBoxSniffer
+    '''
+
+    sniffer = NukeBoxSniffer()
+    sniffer.feedFile(path, os.path.getsize(path))
+    sniffer.finish()
+    return sniffer.format
+
+
+def fromFilename(name):
+
+    '''
+    Returns the (Artist, Title) an Untagged Track's File Name Suggests
+
+      - '01 Foals - Spanish Sahara.mp3' gives ('Foals', 'Spanish Sahara')
+      - Without an Artist, it is UNKNOWN_ARTIST
+    '''
+
+    if isinstance(name, str):
+        name = name.decode('utf-8', 'replace')
+
+    stem = os.path.splitext(os.path.basename(name))[0]
+    stem = TRACK_NUMBER.sub(u'', stem).replace(u'_', u' ').strip()
+
+    if u' - ' in stem:
+        artist, title = stem.split(u' - ', 1)
+        if artist.strip() and title.strip():
+            return artist.strip(), title.strip()
+
+    return UNKNOWN_ARTIST, stem or u'Untitled'
+
+
+def readTags(path, filetype=None, name=None):
+
+    '''
+    Reads the Tags & Length of a Track, Runs in a Worker Thread or Process
+
+      - "filetype" is the Extension the Sniffer Found, Sniffed Here if
+        not Given
+      - "name" is the File's Original Name, Used when the Artist or
+        Title Tag is Missing, see fromFilename
+      - Returns a Dict of filetype, title, artist, album, genre &
+        duration ('m:ss')
+      - Raises MetaError if the File can't be Read
+    '''
+
+    try:
+        if filetype is None:
+            filetype = sniffFile(path)
+        tags, length = READERS[filetype](path)
+
+    except MetaError:
+        raise
+    except Exception as err:
+        raise MetaError('Unreadable {}: {}'.format(filetype, err))
+
+    # Untagged, Name it after the File
+    if not tags.get('artist') or not tags.get('title'):
+        artist, title = fromFilename(name or path)
+        tags['artist'] = tags.get('artist') or artist
+        tags['title'] = tags.get('title') or title
+
+    seconds = int(length)
+
+    return {'filetype': filetype,
+            'title': tags['title'].split('/')[-1],
+            'artist': tags['artist'],
+            'album': tags.get('album'),
+            'genre': tags.get('genre'),
+            'duration': '{}:{:02d}'.format(seconds // 60, seconds % 60)
+            }
@@ -0,0 +1,396 @@
+#!/usr/bin/env python
+
+import os
+import subprocess
+
+
+# Raw PCM Format Shared by the Decoder & the Sinks (CD Quality)
+RATE = 44100
+CHANNELS = 2
+SAMPLE_BYTES = 2
+
+# Bytes Moved per Write, ~50ms of Audio
+CHUNK = RATE * CHANNELS * SAMPLE_BYTES / 20
+
+
+class NukeBoxDecoder(object):
+
+    '''
+    B{NukeBox 2000 Decoder Class}
+
+      - Decodes one Track to Raw PCM in a Child Process
+      - Responsible for:
+
+        - Starting the Decode Ahead of Time (Prefetch)
+        - Holding the First Few Seconds so the Track Starts Instantly
+        - Applying the Track's Gain, so Tracks Play Equally Loud
+    '''
+
+    def __init__(self, path, prefetch=RATE * CHANNELS * SAMPLE_BYTES * 2,
+                 gain=None, track=None):
+
+        '''
+        Decoder Constructor
+
+          - Starts the Decoder Process Straight Away
+          - "gain" is in dB, None (Unknown) Plays the Track as it is
+          - "track" is the Track's Path, if "path" is a Copy of it
+        '''
+
+        self.path = path
+        self.track = track or path
+        self.gain = gain
+        self.prefetch = prefetch
+
+        # Decoded Audio Read Ahead of Playback
+        self.buffered = []
+        self.buffered_len = 0
+
+        # Decode to Raw Signed 16 bit Little Endian at the Sink's Rate
+        args = ['ffmpeg', '-nostdin', '-v', 'error', '-i', path]
+        if gain:
+            args += ['-af', 'volume={:.2f}dB'.format(gain)]
+        args += ['-f', 's16le',
+                 '-ar', str(RATE),
+                 '-ac', str(CHANNELS),
+                 'pipe:1']
+
+        self.proc = subprocess.Popen(args, stdout=subprocess.PIPE)
+
+    def fill(self):
+
+        '''
+        Reads one more Chunk Ahead, until the Prefetch Limit
+
+          - Returns False once Nothing more is Needed
+        '''
+
+        if self.buffered_len >= self.prefetch:
+            return False
+
+        data = self.proc.stdout.read(CHUNK)
+        if not data:
+            return False
+
+        self.buffered.append(data)
+        self.buffered_len += len(data)
+        return True
+
+    def read(self):
+
+        '''
+        Returns the Next Chunk of PCM, or '' at the End of the Track
+        '''
+
+        if self.buffered:
+            data = self.buffered.pop(0)
+            self.buffered_len -= len(data)
+            return data
+
+        return self.proc.stdout.read(CHUNK)
+
+    def close(self):
+
+        '''
+        Stops the Decoder Process
+        '''
+
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.stdout.close()
+        self.proc.wait()
+
+
+class NukeBoxSink(object):
+
+    '''
+    B{NukeBox 2000 Null Sink Class}
+
+      - Discards the Audio, for Testing without a Sound Card
+      - Base Class for the other Sinks
+    '''
+
+    def __init__(self):
+
+        '''
+        Sink Constructor
+        '''
+
+        # Tracks Played so far, Handy when Testing
+        self.played = []
+
+    def start(self, path):
+
+        '''
+        Called as each Track Starts
+        '''
+
+        self.played.append(path)
+
+    def write(self, data):
+
+        '''
+        Consumes a Chunk of PCM
+        '''
+
+        pass
+
+    def close(self):
+
+        '''
+        Releases the Sink
+        '''
+
+        pass
+
+
+class NukeBoxFileSink(NukeBoxSink):
+
+    '''
+    B{NukeBox 2000 File Sink Class}
+
+      - Appends the Raw PCM of every Track to one File
+    '''
+
+    def __init__(self, path):
+
+        '''
+        File Sink Constructor
+        '''
+
+        super(NukeBoxFileSink, self).__init__()
+        self.f = open(path, 'ab')
+
+    def write(self, data):
+
+        '''
+        Writes a Chunk of PCM to the File
+        '''
+
+        self.f.write(data)
+
+    def close(self):
+
+        '''
+        Closes the File
+        '''
+
+        self.f.close()
+
+
+class NukeBoxAplaySink(NukeBoxSink):
+
+    '''
+    B{NukeBox 2000 ALSA Sink Class}
+
+      - One Persistent aplay Process for the Life of the Server
+      - Tracks are Written Back to Back, so there is no Gap between them
+    '''
+
+    def __init__(self):
+
+        '''
+        ALSA Sink Constructor
+
+          - Starts the aplay Process
+        '''
+
+        super(NukeBoxAplaySink, self).__init__()
+        self.proc = subprocess.Popen(['aplay', '-q',
+                                      '-t', 'raw',
+                                      '-f', 'S16_LE',
+                                      '-r', str(RATE),
+                                      '-c', str(CHANNELS)],
+                                     stdin=subprocess.PIPE)
+
+    def write(self, data):
+
+        '''
+        Feeds a Chunk to aplay, Blocking at Playback Speed
+        '''
+
+        self.proc.stdin.write(data)
+
+    def close(self):
+
+        '''
+        Lets aplay Drain & Exit
+        '''
+
+        self.proc.stdin.close()
+        self.proc.wait()
+
+
+def makeSink(spec):
+
+    '''
+    Builds a Sink from its Name
+
+      - 'aplay' for the Sound Card (the Default)
+      - 'null' to Discard the Audio
+      - 'file:/some/path.pcm' to Keep the Raw Audio
+    '''
+
+    if spec == 'null':
+        return NukeBoxSink()
+    if spec.startswith('file:'):
+        return NukeBoxFileSink(spec[len('file:'):])
+    return NukeBoxAplaySink()
+
+
+class NukeBoxPlayer(object):
+
+    '''
+    B{NukeBox 2000 Player Class}
+
+      - Gapless Playback Engine
+      - Responsible for:
+
+        - Taking Entries from the NukeBoxQueue
+        - Decoding the Next Track while the Current one Plays
+        - Feeding Decoded Audio to a Persistent Sink
+        - Normalising Loudness, with the Gain Looked up for each Track
+        - Playing a Track's Transcoded Copy, where it has one
+    '''
+
+    def __init__(self, q, sink, gain=None, locate=None):
+
+        '''
+        Player Constructor
+
+          - "gain" Returns a Track's Gain in dB given its Path (or None),
+            Without it Tracks Play as they are
+          - "locate" Returns the File to Decode for a Track's Path (e.g.
+            NukeBoxTranscode.playable), Without it the Track is Decoded
+        '''
+
+        self.q = q
+        self.sink = sink
+        self.gain = gain
+        self.locate = locate
+
+        # The Decoder Prefetching the Up-Next Track
+        self.next = None
+
+    def open(self, user_path):
+
+        '''
+        Starts Decoding a Queue Entry, Returns None if it can't be Played
+        '''
+
+        # Split the String into a User ID & File Path
+        mac_id, path = user_path.split(':', 1)
+
+        # If the File Does Not Exist, Skip it
+        if not os.path.isfile(path):
+            print('Missing File {}, Skipping'.format(path))
+            return None
+
+        print('User {} - Up Next {}'.format(mac_id, path))
+
+        # Gains are Stored against the Track, not its Transcoded Copy
+        gain = self.gain(path) if self.gain else None
+        source = self.locate(path) if self.locate else path
+
+        try:
+            return NukeBoxDecoder(source, gain=gain, track=path)
+
+        except OSError as err:
+            print('Decoder Failed: {}'.format(err))
+            return None
+
+    def relocate(self, decoder):
+
+        '''
+        Returns the Decoder to Play a Prefetched Track with
+
+          - Where a Transcoded Copy has Appeared since the Track was
+            Prefetched, it is Decoded Instead (the Prefetch is Dropped)
+        '''
+
+        if self.locate is None:
+            return decoder
+
+        source = self.locate(decoder.track)
+        if source == decoder.path:
+            return decoder
+
+        try:
+            fresh = NukeBoxDecoder(source, gain=decoder.gain,
+                                   track=decoder.track)
+
+        except OSError as err:
+            print('Decoder Failed: {}'.format(err))
+            return decoder
+
+        decoder.close()
+        return fresh
+
+    def prefetch(self, timeout=0):
+
+        '''
+        Starts the Up-Next Decoder if a Track is Waiting
+
+          - Never Blocks by Default, the Queue is Peeked with a Zero Timeout
+          - The Entry Stays Queued (& Journaled) until it Starts Playing,
+            so a Restart Meanwhile doesn't Lose it
+          - Entries that can't be Played are Dropped
+          - Returns False once the Queue is Closed
+        '''
+
+        while self.next is None:
+            user_path = self.q.peek(timeout)
+            if user_path is None:
+                return not self.q.closed
+
+            self.next = self.open(user_path)
+            if self.next is None:
+                self.q.popleft()
+
+        return True
+
+    def run(self):
+
+        '''
+        Playback Loop
+
+          - Runs in Thread of its own
+          - Sleeps on the Queue while there is Nothing to Play
+          - Returns once the Queue is Closed
+        '''
+
+        print('Playback called!')
+
+        while True:
+
+            # Wait (no Polling) if Nothing has been Prefetched
+            if self.next is None:
+                if not self.prefetch(timeout=None):
+                    break
+                continue
+
+            # Shutting Down, the Up-Next Track is Left Queued for Next Time
+            if self.q.closed:
+                break
+
+            # Playing Now, so Only Now does it Leave the Queue
+            current, self.next = self.next, None
+            self.q.popleft()
+            current = self.relocate(current)
+            print('Playing {}'.format(current.path))
+            self.sink.start(current.path)
+
+            # Stream the Current Track, Preparing the Next as we Go
+            try:
+                for data in iter(current.read, ''):
+                    self.sink.write(data)
+                    self.prefetch()
+                    if self.next is not None:
+                        self.next.fill()
+            finally:
+                current.close()
+
+        # Drop any Prefetched Track & Release the Sink
+        if self.next is not None:
+            self.next.close()
+        self.sink.close()
@@ -1,84 +1,309 @@
 #!/usr/bin/env python
 
+import time
+import threading
 import collections
 
 
-class NukeBoxQueue(collections.deque):
+class NukeBoxQueue(object):
 
     '''
     B{NukeBox 2000 Queue Class}
 
-      - NukeBox Queue Object
-      - Subclass of collections.deque
+      - NukeBox Fair-Share Queue Object
+      - Entries are "mac_id:path" Strings
       - Responsible for:
 
         - Adding/Removing items to/from the Queue
+        - Taking Turns between Users (Round Robin by mac_id)
+        - Waking any Thread Waiting for a New item
+        - Optionally Journaling Changes so a Restart Recovers the Queue
+
+    Every Operation but Iteration is O(1): each User has their own deque,
+    the Users with Something Queued take Turns from a Rotation deque & a
+    Count of each Entry answers "in" without a Scan.
     '''
 
-    def __init__(self):
+    def __init__(self, journal=None, compact_min=256):
 
         '''
         Queue Constructor
 
-          - Calls Super on self
+          - Creates the Per-User Queues, the Rotation & the Index
+          - Creates the Condition Waiting Consumers Sleep on
+          - Replays the Journal (a NukeBoxJournal), if Given
+        '''
+
+        # Each User's Entries in the Order they were Added
+        self.users = {}
+
+        # Users with Entries, Front of the deque Plays Next
+        self.rotation = collections.deque()
+
+        # How many Times each Entry is Queued (for "in")
+        self.index = collections.Counter()
+        self.count = 0
+
+        # Guards the Queues & Wakes Consumers when Items Arrive
+        self.cond = threading.Condition()
+        self.closed = False
+
+        # Durable Backend, Compacted once it Holds this many Stale Records
+        self.journal = None
+        self.compact_min = compact_min
+
+        if journal is not None:
+            self.recover(journal)
+
+    def recover(self, journal):
+
+        '''
+        Rebuilds the Queue from a Journal & Starts Logging to it
+
+          - Replaying the same Appends & Pops in Order Reproduces the
+            same Rotation, so Turns are Recovered too
+        '''
+
+        start = time.time()
+
+        for op, entry in journal.replay():
+            if op == 'A':
+                self.append(entry, quiet=True)
+            elif self.count:
+                self.popleft()
+
+        # Start Afresh from a Snapshot of what is Left
+        journal.compact(list(self))
+        self.journal = journal
+
+        print('Recovered {} Queued Entries in {:.1f} ms'.format(
+            self.count, (time.time() - start) * 1000))
+
+    def __len__(self):
+
+        '''
+        Returns the Total Number of Queued Entries
+        '''
+
+        return self.count
+
+    def __contains__(self, value):
+
         '''
+        Membership Test, O(1) via the Index
+        '''
+
+        return self.index[value] > 0
+
+    def __iter__(self):
+
+        '''
+        Yields the Entries in the Order they will Play
+
+          - O(n), Walks the Rotation without Changing it
+        '''
+
+        with self.cond:
+            queues = [list(self.users[mac_id]) for mac_id in self.rotation]
 
-        super(NukeBoxQueue, self).__init__()
+        turn = 0
+        while queues:
+            queues = [entries for entries in queues if len(entries) > turn]
+            for entries in queues:
+                yield entries[turn]
+            turn += 1
+
+    def __repr__(self):
+
+        '''
+        Shows the Entries in Play Order
+        '''
+
+        return 'NukeBoxQueue({!r})'.format(list(self))
 
     def popleft(self):
 
         '''
-        Deque Pop Left Method
+        Pop Left Method
 
-          - Retrieve & Returns an item
+          - Retrieve & Returns the Next User's Oldest item
+          - The User then Goes to the Back of the Rotation
+          - Raises IndexError when Empty, like a deque
         '''
 
-        file = collections.deque.popleft(self)
+        with self.cond:
+            if not self.count:
+                raise IndexError('pop from an empty NukeBoxQueue')
+
+            # Whose Turn is it?
+            mac_id = self.rotation.popleft()
+            entries = self.users[mac_id]
+            file = entries.popleft()
+
+            # Back of the Line if they Have More, Otherwise Forget them
+            if entries:
+                self.rotation.append(mac_id)
+            else:
+                del self.users[mac_id]
+
+            self.index[file] -= 1
+            if not self.index[file]:
+                del self.index[file]
+            self.count -= 1
+
+            # Once Closed the Journal is too, what's Left is Recovered
+            if self.journal is not None and not self.closed:
+                self.journal.log('P', file)
+                self.compact()
+
         if len(self) is 0:
             print('Queue Now Empty')
         return file
 
-    def append(self, value):
+    def append(self, value, quiet=False):
 
         '''
-        Deque Append Method
+        Append Method
 
-          - Add an item
+          - Add an item to its User's Queue
+          - A User New to the Rotation Joins at the Back
+          - Wakes one Waiting Consumer
           - Returns boolean value
         '''
 
-        print('Inside Deque Module: '
-              'Value: {}'.format(value))
-        if collections.deque.append(self, value):
+        if not quiet:
+            print('Inside Queue Module: '
+                  'Value: {}'.format(value))
+
+        mac_id = value.split(':', 1)[0]
+
+        with self.cond:
+            if mac_id not in self.users:
+                self.users[mac_id] = collections.deque()
+                self.rotation.append(mac_id)
+
+            self.users[mac_id].append(value)
+            self.index[value] += 1
+            self.count += 1
+
+            if self.journal is not None and not self.closed:
+                self.journal.log('A', value)
+
+            self.cond.notify()
+
+        if not quiet:
             print('Added to Queue')
-            return True
-        return False
-        # print('Queue Length Currently {}'.format(str(len(self))))
+        return True
+
+    def compact(self):
+
+        '''
+        Compacts the Journal once Mostly Stale
+
+          - Called with the Lock Held
+        '''
+
+        if self.journal.records > 2 * self.count + self.compact_min and \
+                not self.journal.compacting:
+            self.journal.compact(list(self))
+
+    def wait(self, timeout=None):
+
+        '''
+        Sleeps (no Polling) until an item is Available
+
+          - Returns False on Timeout or once the Queue is Closed
+          - Called with the Lock Held
+        '''
+
+        # Condition.wait can't Report a Timeout in Python 2, use a Deadline
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        while not self.count and not self.closed:
+
+            if timeout is not None:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    return False
+
+            self.cond.wait(timeout)
+
+        return not self.closed
+
+    def get(self, timeout=None):
+
+        '''
+        Blocking Pop Left Method
+
+          - Sleeps (no Polling) until an item is Available
+          - Returns None on Timeout or once the Queue is Closed
+        '''
+
+        with self.cond:
+            return self.popleft() if self.wait(timeout) else None
+
+    def peek(self, timeout=None):
+
+        '''
+        Blocking Peek Method
+
+          - Returns the item popleft would, Leaving it Queued
+          - Sleeps (no Polling) until an item is Available
+          - Returns None on Timeout or once the Queue is Closed
+        '''
+
+        with self.cond:
+            if not self.wait(timeout):
+                return None
+            return self.users[self.rotation[0]][0]
+
+    def close(self):
+
+        '''
+        Wakes Every Waiting Consumer so it can Exit
+
+          - Syncs & Closes the Journal, if Any
+        '''
+
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+            if self.journal is not None:
+                self.journal.close()
 
 
 if __name__ == '__main__':
 
     # Testing
-    to_q_1 = 'I am an entry'
-    to_q_2 = 'I am also an entry'
+    to_q_1 = 'guest1:I am an entry'
+    to_q_2 = 'guest1:I am also an entry'
+    to_q_3 = 'guest2:I jumped the queue'
     q = NukeBoxQueue()
     q.append(to_q_1)
     q.append(to_q_2)
+    q.append(to_q_3)
     if len(q) is not 0:
         print('Q Not Empty')
     result_1 = q.popleft()
     print('Result 1 is ' + result_1)
     print(str(q))
-    result_2 = q.popleft()
+    result_2 = q.get()
     print('Result 2 is ' + result_2)
+    result_3 = q.get()
+    print('Result 3 is ' + result_3)
+    print('Result 4 is ' + str(q.get(timeout=0.1)))
 
 
 # # Output
-# Inside Deque Module: Value: I am an entry
+# Inside Queue Module: Value: guest1:I am an entry
 # Added to Queue
-# deque(['I am an entry'])
-# Queue Length Currently 1
-# Q not empty
+# ...
+# Q Not Empty
+# Result 1 is guest1:I am an entry
+# NukeBoxQueue(['guest2:I jumped the queue', 'guest1:I am also an entry'])
+# Result 2 is guest2:I jumped the queue
 # Queue Now Empty
-# I am an entry
-
+# Result 3 is guest1:I am also an entry
+# Result 4 is None
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+
+import re
+import heapq
+import bisect
+import threading
+
+
+# Searchable Files Columns & how much a Match in each Counts
+FIELDS = (('title', 4), ('artist', 3), ('album', 2), ('genre', 1))
+
+# How much an Exact, a Prefix & a Fuzzy (one Typo) Match Count
+EXACT = 3
+PREFIX = 2
+FUZZY = 1
+
+# Shorter Terms only Match Exactly / by Prefix, Typos would Match Anything
+FUZZY_MIN = 4
+
+# Single Letters only Match Whole Words, as a Prefix they Match Too Much
+PREFIX_MIN = 2
+
+# Words are Runs of Letters & Digits, in any Language
+WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+
+    '''
+    Splits Text into Lower Case Words
+    '''
+
+    if not text:
+        return []
+    if isinstance(text, str):
+        text = text.decode('utf-8', 'replace')
+    return WORD.findall(text.lower())
+
+
+def deletions(word):
+
+    '''
+    Returns the Variants of a Word with one Letter Removed
+
+      - Two Words within one Typo of each other Share a Variant (or one
+        is a Variant of the other)
+    '''
+
+    return set(word[:n] + word[n + 1:] for n in range(len(word)))
+
+
+class NukeBoxSearch(object):
+
+    '''
+    B{NukeBox 2000 Search Class}
+
+      - In Memory Inverted Index over the Track Library
+      - Responsible for:
+
+        - Indexing the Title, Artist, Album & Genre of each File
+        - Answering Exact, Prefix & Fuzzy (one Typo) Queries
+        - Ranking & Paging the Results
+
+    Every Term of a Query must Match (AND). Prefixes are Found by
+    Bisecting the Sorted Vocabulary, Typos through an Index of each Word's
+    Single Deletions, so no Query Scans the Library.
+
+    B{Syntax}
+
+      >>> index = NukeBoxSearch()
+      >>> index.add(file_obj)
+      >>> index.search('foals what wen', page=1, per_page=20)
+    '''
+
+    def __init__(self):
+
+        '''
+        Search Constructor
+        '''
+
+        # Word -> {file_id: Field Weight}
+        self.postings = {}
+
+        # Every Word, Sorted, for Prefix Lookups
+        self.words = []
+
+        # Deletion Variant -> Words Producing it, for Fuzzy Lookups
+        self.variants = {}
+
+        # file_id -> (Words, Result Dict)
+        self.docs = {}
+
+        self.lock = threading.RLock()
+
+    def __len__(self):
+
+        '''
+        Returns the Number of Files Indexed
+        '''
+
+        return len(self.docs)
+
+    def add(self, obj):
+
+        '''
+        Indexes (or Re-Indexes) a Files Row
+        '''
+
+        # The Best Weight each Word Appears with
+        weights = {}
+        for field, weight in FIELDS:
+            for word in tokenize(getattr(obj, field)):
+                weights[word] = max(weight, weights.get(word, 0))
+
+        doc = {'file_id': obj.file_id,
+               'title': obj.title,
+               'artist': obj.artist,
+               'album': obj.album,
+               'genre': obj.genre
+               }
+
+        with self.lock:
+            self.remove(obj.file_id)
+            self.docs[obj.file_id] = (weights.keys(), doc)
+
+            for word, weight in weights.items():
+                if word not in self.postings:
+                    self.addWord(word)
+                self.postings[word][obj.file_id] = weight
+
+    def remove(self, file_id):
+
+        '''
+        Drops a File from the Index, if it is there
+        '''
+
+        with self.lock:
+            if file_id not in self.docs:
+                return
+
+            words, _ = self.docs.pop(file_id)
+            for word in words:
+                del self.postings[word][file_id]
+                if not self.postings[word]:
+                    self.removeWord(word)
+
+    def addWord(self, word):
+
+        '''
+        Adds a Word to the Vocabulary & the Fuzzy Index
+        '''
+
+        self.postings[word] = {}
+        bisect.insort(self.words, word)
+
+        for variant in deletions(word):
+            self.variants.setdefault(variant, set()).add(word)
+
+    def removeWord(self, word):
+
+        '''
+        Removes a Word no File Uses any more
+        '''
+
+        del self.postings[word]
+        del self.words[bisect.bisect_left(self.words, word)]
+
+        for variant in deletions(word):
+            self.variants[variant].discard(word)
+            if not self.variants[variant]:
+                del self.variants[variant]
+
+    def matches(self, term):
+
+        '''
+        Returns {Word: Match Quality} for every Word a Term Matches
+        '''
+
+        found = {}
+
+        if term in self.postings:
+            found[term] = EXACT
+
+        # Words Starting with the Term
+        if len(term) >= PREFIX_MIN:
+            start = bisect.bisect_right(self.words, term)
+            for word in self.words[start:]:
+                if not word.startswith(term):
+                    break
+                found[word] = PREFIX
+
+        # Words one Typo Away
+        if len(term) >= FUZZY_MIN:
+            candidates = set(self.variants.get(term, ()))
+            for variant in deletions(term):
+                if variant in self.postings:
+                    candidates.add(variant)
+                candidates.update(self.variants.get(variant, ()))
+
+            for word in candidates:
+                found.setdefault(word, FUZZY)
+
+        return found
+
+    def search(self, query, page=1, per_page=20):
+
+        '''
+        Finds the Files Matching every Term of the Query
+
+          - Returns {'total': n, 'page': page, 'results': [...]}, each
+            Result a Dict of file_id, title, artist, album & genre
+          - Best Matches First, then by Title
+        '''
+
+        terms = tokenize(query)
+        if not terms or page < 1:
+            return {'total': 0, 'page': page, 'results': []}
+
+        with self.lock:
+            scores = None
+
+            for term in terms:
+
+                # This Term's Best Score for each File
+                term_scores = {}
+                for word, quality in self.matches(term).items():
+                    for file_id, weight in self.postings[word].items():
+                        score = quality * weight
+                        if score > term_scores.get(file_id, 0):
+                            term_scores[file_id] = score
+
+                # Keep Files Matching every Term so far
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = dict((file_id, score + term_scores[file_id])
+                                  for file_id, score in scores.items()
+                                  if file_id in term_scores)
+
+                if not scores:
+                    break
+
+            # Only Rank as many as this Page Needs
+            ranked = heapq.nsmallest(
+                page * per_page, scores.items(),
+                key=lambda (file_id, score): (-score,
+                                              self.docs[file_id][1]['title']))
+
+            results = [dict(self.docs[file_id][1])
+                       for file_id, _ in ranked[(page - 1) * per_page:]]
+
+        return {'total': len(scores), 'page': page, 'results': results}
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+import os
+
+from twisted.internet.utils import getProcessOutputAndValue
+
+from NukeBoxConfig import config
+from NukeBoxPlayer import RATE, CHANNELS
+
+
+# Canonical Copies are Stored Next to the Original, e.g. ab12....mp3 has
+# ab12....play.flac, Lossless at the Player's Rate so it Decodes Quickest
+SUFFIX = '.play.flac'
+
+
+def canonicalPath(path):
+
+    '''
+    Returns where a Track's Canonical Copy is (or would be) Stored
+    '''
+
+    return os.path.splitext(path)[0] + SUFFIX
+
+
+def playable(path):
+
+    '''
+    Returns the Canonical Copy of a Track if it has one, else the Track
+    '''
+
+    canonical = canonicalPath(path)
+    return canonical if os.path.isfile(canonical) else path
+
+
+def command(path, out):
+
+    '''
+    Returns the ffmpeg Arguments Converting a Track to the Canonical Format
+
+      - The First Audio Stream only, Cover Art & Video are Dropped
+      - 16 bit at the Player's Rate & Channels, FLAC Compressed
+    '''
+
+    return ['-nostdin', '-v', 'error', '-y',
+            '-i', path,
+            '-map', '0:a:0',
+            '-ar', str(RATE),
+            '-ac', str(CHANNELS),
+            '-sample_fmt', 's16',
+            '-c:a', 'flac',
+            '-f', 'flac',
+            out]
+
+
+class NukeBoxTranscode(object):
+
+    '''
+    B{NukeBox 2000 Transcode Class}
+
+      - Background Conversion of Uploads to one Canonical Format
+      - Responsible for:
+
+        - Running at most "processes" ffmpeg Conversions at a Time
+        - Converting the Track Next Up in the NukeBoxQueue First
+        - Writing to a Temp File & Renaming, so the Player never Sees a
+          Partial Copy (see playable)
+
+    Each Conversion is an ffmpeg Process Spawned by the Reactor, so the
+    Work is Spread over the Cores & Nothing Blocks the Server.
+
+    B{Syntax}
+
+      >>> transcoder = NukeBoxTranscode(q, processes=2)
+      >>> transcoder.submit('/home/user/Music/NukeBox2000/ab/ab12....mp3')
+    '''
+
+    def __init__(self, q, processes=None):
+
+        '''
+        Transcode Constructor
+
+          - Defaults to the [transcode] Settings in the Config
+        '''
+
+        self.q = q
+        self.processes = processes or config.getint('transcode', 'processes')
+
+        # Paths Waiting (Oldest First) & Being Converted
+        self.pending = []
+        self.running = set()
+
+        # Paths ffmpeg couldn't Convert, they Play as they are
+        self.failed = set()
+
+    def submit(self, path):
+
+        '''
+        Asks for a Canonical Copy of a Stored Track
+
+          - Tracks Already Converted (or Waiting, or Failed) are Skipped
+        '''
+
+        if path in self.running or path in self.failed or \
+                path in self.pending or path.endswith(SUFFIX) or \
+                os.path.isfile(canonicalPath(path)):
+            return
+
+        self.pending.append(path)
+        self.next()
+
+    def next(self):
+
+        '''
+        Starts Conversions while there are Free Processes
+        '''
+
+        while self.pending and len(self.running) < self.processes:
+            path = self.pick()
+            self.pending.remove(path)
+            self.running.add(path)
+
+            d = self.convert(path)
+            d.addErrback(self.convertFailed, path)
+            d.addBoth(self.finished, path)
+
+    def pick(self):
+
+        '''
+        Returns the Waiting Path to Convert Next
+
+          - The one Earliest in the Play Queue, otherwise the Oldest
+          - The Up-Next Track Stays Queued while the Player Prefetches it,
+            so it is Picked too, & the Player Switches to its Copy if it
+            is Ready by the Time the Track Starts (see NukeBoxPlayer)
+        '''
+
+        waiting = set(self.pending)
+
+        for entry in self.q:
+            path = entry.split(':', 1)[1]
+            if path in waiting:
+                return path
+
+        return self.pending[0]
+
+    def convert(self, path):
+
+        '''
+        Runs ffmpeg on one Track, Returns a Deferred
+        '''
+
+        canonical = canonicalPath(path)
+        temp = canonical + '.part'
+
+        d = getProcessOutputAndValue('ffmpeg', command(path, temp),
+                                     env=os.environ)
+        d.addCallback(self.converted, path, temp, canonical)
+        return d
+
+    def converted(self, result, path, temp, canonical):
+
+        '''
+        Puts the Finished Copy in Place, or Raises if ffmpeg Failed
+        '''
+
+        out, err, code = result
+
+        if code != 0:
+            if os.path.isfile(temp):
+                os.remove(temp)
+            lines = err.strip().splitlines() or ['Exit Code {}'.format(code)]
+            raise RuntimeError(lines[-1])
+
+        os.rename(temp, canonical)
+        print('Transcoded {}'.format(path))
+
+    def convertFailed(self, failure, path):
+
+        '''
+        Reports a Failed Conversion, it isn't Tried again
+        '''
+
+        self.failed.add(path)
+        print('Transcoding Failed for {}: {}'.format(
+            path, failure.getErrorMessage()))
+
+    def finished(self, _, path):
+
+        '''
+        Frees the Process for the Next Conversion
+        '''
+
+        self.running.discard(path)
+        self.next()
@@ -57,6 +57,106 @@ file_obj = nbq.create(file_details)
 # #                        # CREATE TESTS END #
 # #-----------------------------------------------------------------------#
 
+# #-----------------------------------------------------------------------#
+# #                     # BATCH CREATE TESTS BEGIN #
+# #-----------------------------------------------------------------------#
+
+# Batch of File Details, the First Re-Tags the File Created Above
+files_details = [{'Model': 'Files',
+                  'path': '/home/music/what_went_down.mp3',
+                  'size': 10000,
+                  'filetype': 'mp3',
+                  'title': 'WHAT WENT DOWN',
+                  'artist': 'Foals',
+                  'genre': 'Indie',
+                  'album': 'WHAT WENT DOWN',
+                  'duration': '5:00',
+                  'hash': 'sha256:what_went_down',
+                  'user_id': user_obj.user_id
+                  },
+                 {'Model': 'Files',
+                  'path': '/home/music/birch_tree.mp3',
+                  'size': 12000,
+                  'filetype': 'mp3',
+                  'title': 'BIRCH TREE',
+                  'artist': 'Foals',
+                  'genre': 'Indie',
+                  'album': 'WHAT WENT DOWN',
+                  'duration': '5:10',
+                  'hash': 'sha256:birch_tree',
+                  'user_id': user_obj.user_id
+                  }
+                 ]
+
+# Get/Create the File objects, in one Transaction
+file_objs = nbq.create_many(files_details)
+
+for f_result in file_objs:
+    print(f_result.file_id, f_result.path, f_result.hash)
+
+# The Cache must Hold the Re-Tagged Row, not the one Created Above
+assert nbq.read(Model='Files',
+                path='/home/music/what_went_down.mp3').hash == \
+    'sha256:what_went_down'
+
+# Re-Hash a File, its Old hash must no longer be Found (even Cached)
+nbq.create_many([{'Model': 'Files',
+                  'path': '/home/music/birch_tree.mp3',
+                  'hash': 'sha256:birch_tree_v2'
+                  }
+                 ])
+
+assert nbq.read_many([{'Model': 'Files',
+                       'hash': 'sha256:birch_tree'}]) == [None]
+
+# Put it Back for the Reads Below
+nbq.create_many([{'Model': 'Files',
+                  'path': '/home/music/birch_tree.mp3',
+                  'hash': 'sha256:birch_tree'
+                  }
+                 ])
+
+# #-----------------------------------------------------------------------#
+# #                      # BATCH CREATE TESTS END #
+# #-----------------------------------------------------------------------#
+
+# #-----------------------------------------------------------------------#
+# #                      # BATCH READ TESTS BEGIN #
+# #-----------------------------------------------------------------------#
+
+# One Column to Filter on per Dictionary, None Comes Back for No Match
+files_details = [{'Model': 'Files', 'hash': 'sha256:birch_tree'},
+                 {'Model': 'Files', 'path': '/home/music/missing.mp3'},
+                 {'Model': 'Files', 'path': '/home/music/what_went_down.mp3'}
+                 ]
+
+# Call to the Batch Read Method
+f_results = nbq.read_many(files_details)
+
+assert f_results[1] is None
+assert [f.title for f in f_results if f is not None] == \
+    ['BIRCH TREE', 'WHAT WENT DOWN']
+
+# #-----------------------------------------------------------------------#
+# #                       # BATCH READ TESTS END #
+# #-----------------------------------------------------------------------#
+
+# #-----------------------------------------------------------------------#
+# #                        # SEARCH TESTS BEGIN #
+# #-----------------------------------------------------------------------#
+
+# Every Word must Match, the Last may be a Prefix, one Typo is Allowed
+found = nbq.search('foals brich')
+
+for track in found['results']:
+    print(track['file_id'], track['title'], track['artist'])
+
+assert 'BIRCH TREE' in [track['title'] for track in found['results']]
+
+# #-----------------------------------------------------------------------#
+# #                         # SEARCH TESTS END #
+# #-----------------------------------------------------------------------#
+
 # #-----------------------------------------------------------------------#
 # #                        # READ TESTS BEGIN #
 # #-----------------------------------------------------------------------#
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import time
+import random
+
+# Benchmark against a Scratch DB, not the Real One
+os.environ.setdefault('NUKEBOX_DB', 'sqlite://')
+
+from NukeBoxDB import NukeBoxQuery, setup
+from models import Files
+
+
+# #-----------------------------------------------------------------------#
+
+# Library Size & the Searches per Query
+SIZE = int(sys.argv[1]) if sys.argv[1:] else 100000
+SEARCHES = 50
+
+# Made up Words, so Prefixes & Typos have Plenty to Match
+random.seed(2000)
+WORDS = [''.join(random.choice('abcdefghijklmnopqrstuvwxyz')
+                 for _ in range(random.randint(3, 9)))
+         for _ in range(30000)]
+
+
+def fill(user_id):
+
+    '''
+    Inserts SIZE Files, in Batches of 10k Rows
+    '''
+
+    for first in range(0, SIZE, 10000):
+        rows = [{'path': '/music/{:06d}.mp3'.format(n),
+                 'title': ' '.join(random.sample(WORDS, 3)),
+                 'artist': ' '.join(random.sample(WORDS[:5000], 2)),
+                 'album': ' '.join(random.sample(WORDS, 2)),
+                 'genre': random.choice(WORDS[:50]),
+                 'hash': 'sha256:{:064x}'.format(n),
+                 'size': 300000,
+                 'filetype': '.mp3',
+                 'user_id': user_id
+                 }
+                for n in range(first, min(first + 10000, SIZE))]
+        engine.execute(Files.__table__.insert(), rows)
+
+
+def timed(query, page=1):
+
+    '''
+    Returns the Matches & the Mean Time in ms to Search for the Query
+    '''
+
+    start = time.time()
+    with NukeBoxQuery() as nbq:
+        for _ in range(SEARCHES):
+            found = nbq.search(query, page)
+
+    return found['total'], (time.time() - start) * 1000 / SEARCHES
+
+
+# #-----------------------------------------------------------------------#
+
+engine = setup()
+
+user = NukeBoxQuery().create({'Model': 'Users',
+                              'name': 'Bench',
+                              'mac_id': 'bench'
+                              })
+fill(user.user_id)
+
+# The First Search Builds the Index
+start = time.time()
+with NukeBoxQuery() as nbq:
+    nbq.index()
+print('Index of {} Files Built in {:.1f} secs\n'.format(
+    SIZE, time.time() - start))
+
+word = WORDS[1000]
+queries = [('exact', word, 1),
+           ('prefix', word[:3], 1),
+           ('typo', word[:-1] + ('x' if word[-1] != 'x' else 'y'), 1),
+           ('two terms', WORDS[20] + ' ' + WORDS[21][:2], 1),
+           ('page 10', word[:2], 10),
+           ('no match', 'zzzzzzzz', 1)
+           ]
+
+print('{:>10} {:>12} {:>8} {:>12}'.format('query', 'terms', 'matches',
+                                          'time'))
+
+for label, query, page in queries:
+    print('{:>10} {:>12} {:>8} {:>9.3f} ms'.format(
+        label, query, *timed(query, page)))
+
+
+# # Output (SQLite in Memory, Words of 4+ Letters also Match with a Typo)
+# Index of 100000 Files Built in 5.9 secs
+#
+#      query        terms  matches         time
+#      exact         pvxr      202     0.460 ms
+#     prefix          pvx      183     0.402 ms
+#       typo         pvxx      247     0.499 ms
+#  two terms   ucincoc ss       23     2.119 ms
+#    page 10           pv     1327     3.027 ms
+#   no match     zzzzzzzz        0     0.018 ms
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import time
+import shutil
+import signal
+import socket
+import tempfile
+import subprocess
+
+
+# #-----------------------------------------------------------------------#
+
+# Starts the Server in a Scratch Home Dir (so a Fresh DB) & Times how long
+# it takes to Accept a TCP Connection on 8008 & Answer Discovery on 9009
+RUNS = int(sys.argv[1]) if sys.argv[1:] else 3
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      'twistedServer.py')
+
+
+def tcpUp():
+
+    '''
+    Returns True once the Server Accepts Connections
+    '''
+
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        s.connect(('127.0.0.1', 8008))
+        return True
+    except socket.error:
+        return False
+    finally:
+        s.close()
+
+
+def udpUp():
+
+    '''
+    Returns True once the Server Answers a Discovery Message
+    '''
+
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.settimeout(0.01)
+    try:
+        s.sendto('Hello Jukebox', ('127.0.0.1', 9009))
+        return bool(s.recvfrom(1024)[0])
+    except socket.error:
+        return False
+    finally:
+        s.close()
+
+
+def start(home):
+
+    '''
+    Returns the Seconds until TCP & UDP are both Up
+    '''
+
+    env = dict(os.environ, HOME=home, NUKEBOX_PLAYER_SINK='null')
+    devnull = open(os.devnull, 'w')
+
+    began = time.time()
+    proc = subprocess.Popen([sys.executable, SERVER], env=env,
+                            stdout=devnull, stderr=devnull)
+    up = {}
+
+    try:
+        while len(up) < 2 and proc.poll() is None:
+            if 'tcp' not in up and tcpUp():
+                up['tcp'] = time.time() - began
+            if 'udp' not in up and udpUp():
+                up['udp'] = time.time() - began
+            time.sleep(0.001)
+    finally:
+        proc.send_signal(signal.SIGINT)
+        proc.wait()
+        devnull.close()
+
+    if len(up) < 2:
+        sys.exit('Server Exited Early, Run it by Hand to See Why')
+
+    return up['tcp'], up['udp']
+
+
+# #-----------------------------------------------------------------------#
+
+home = tempfile.mkdtemp()
+
+try:
+    print('{:>6} {:>10} {:>10}'.format('run', 'tcp 8008', 'udp 9009'))
+
+    for run in range(RUNS):
+
+        # The First Run Creates the DB, the Rest find it Verified
+        label = 'fresh' if run == 0 else 'warm'
+        print('{:>6} {:>7.0f} ms {:>7.0f} ms'.format(
+            label, *[t * 1000 for t in start(home)]))
+
+finally:
+    shutil.rmtree(home)
+
+
+# # Output
+#    run   tcp 8008   udp 9009
+#  fresh     172 ms     173 ms
+#   warm     165 ms     165 ms
+#   warm     180 ms     181 ms
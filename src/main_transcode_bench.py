@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import multiprocessing
+
+from NukeBoxTranscode import canonicalPath, command
+
+
+# #-----------------------------------------------------------------------#
+
+# Tracks per Run & each Track's Length in secs
+TRACKS = int(sys.argv[1]) if sys.argv[1:] else 12
+LENGTH = 180
+
+
+def makeTrack(path):
+
+    '''
+    Writes a LENGTH sec 48kHz 320k MP3, Something to Convert
+    '''
+
+    subprocess.check_call(['ffmpeg', '-nostdin', '-v', 'error', '-y',
+                           '-f', 'lavfi',
+                           '-i', 'sine=frequency=440:sample_rate=48000:'
+                                 'duration={}'.format(LENGTH),
+                           '-ac', '2', '-b:a', '320k', path])
+
+
+def run(paths, processes):
+
+    '''
+    Converts every Path, at most "processes" ffmpegs at a Time, as the
+    NukeBoxTranscode does, Returns the Time Taken in secs
+    '''
+
+    start = time.time()
+    waiting = list(paths)
+    running = []
+
+    while waiting or running:
+        while waiting and len(running) < processes:
+            path = waiting.pop(0)
+            running.append(subprocess.Popen(
+                ['ffmpeg'] + command(path, canonicalPath(path))))
+
+        # Refill as soon as any Conversion Finishes
+        time.sleep(0.01)
+        running = [proc for proc in running if proc.poll() is None]
+
+    return time.time() - start
+
+
+# #-----------------------------------------------------------------------#
+
+cores = multiprocessing.cpu_count()
+scratch = tempfile.mkdtemp()
+
+try:
+    source = os.path.join(scratch, 'source.mp3')
+    makeTrack(source)
+
+    paths = []
+    for n in range(TRACKS):
+        paths.append(os.path.join(scratch, '{:02d}.mp3'.format(n)))
+        shutil.copy(source, paths[-1])
+
+    print('{} Tracks of {} secs, {} Cores\n'.format(TRACKS, LENGTH, cores))
+    print('{:>9} {:>10} {:>10} {:>14}'.format('processes', 'time',
+                                              'tracks/s', 'x real/core'))
+
+    for processes in sorted(set([1, 2, 4, cores, cores * 2])):
+        secs = run(paths, processes)
+        used = min(processes, cores)
+
+        print('{:>9} {:>8.2f} s {:>10.2f} {:>14.1f}'.format(
+            processes, secs, TRACKS / secs,
+            TRACKS * LENGTH / secs / used))
+
+finally:
+    shutil.rmtree(scratch)
+
+
+# # Output (1 Core, ffmpeg 7.0, "x real/core" is Audio secs Converted per
+# # sec for each Core in Use, so Flat Means Throughput Scales with Cores)
+# 12 Tracks of 180 secs, 1 Cores
+#
+# processes       time   tracks/s    x real/core
+#         1     9.28 s       1.29          232.7
+#         2     9.52 s       1.26          226.9
+#         4    10.72 s       1.12          201.5
@@ -1,28 +1,214 @@
 #!/usr/bin/env python
 
 import os
+import sys
+import json
+import zlib
+import mmap
+import errno
 import getpass
-import pickle
+import argparse
 # from logger import NukeboxLogger
 from uuid import getnode as get_mac
 from socket import SOL_SOCKET, SO_BROADCAST
 
+from zope.interface import implementer
 from twisted.internet import reactor, protocol
-from twisted.protocols.basic import LineReceiver
+from twisted.internet.interfaces import IPullProducer
 
+from NukeBoxFrame import NukeBoxFrameReceiver, REGISTER, READY, FILE, ACK, \
+    ERROR, QUERY, HAVE, CHUNK, NACK, SEARCH, RESULTS, REQUEST, QUEUED, \
+    encodeFrame
+from NukeBoxIngest import hashFile
 
-class NukeBoxClientProtocol(LineReceiver):
+# Optional Zero-Copy Transmission, the pysendfile Package or Python 3's os
+try:
+    from sendfile import sendfile
+except ImportError:
+    sendfile = getattr(os, 'sendfile', None)
+
+
+@implementer(IPullProducer)
+class NukeBoxChunkProducer(object):
+
+    '''
+    B{NukeBox 2000 Chunk Producer Class}
+
+      - Pull Producer Streaming one File as Checksummed Chunk Frames
+      - Responsible for:
+
+        - Writing one Chunk each time the Transport asks for more
+        - Checksumming straight from a Memory Map (no Copy)
+        - Handing Chunk Bodies to os.sendfile where Available
+    '''
+
+    def __init__(self, transport, fname, tid, offset, chunk_size,
+                 use_sendfile=True):
+
+        '''
+        Chunk Producer constructor method
+        '''
+
+        # Create the Instance Variables
+        self.transport = transport
+        self.tid = tid
+        self.offset = offset
+        self.chunk_size = chunk_size
+
+        # Map the File, the Page Cache is our Only Copy of the Data
+        self.f = open(fname, 'rb')
+        self.size = os.fstat(self.f.fileno()).st_size
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # Body (Offset, Length) Waiting for its Header to be Flushed
+        self.body = None
+
+        # Zero-Copy Needs Linux, sendfile & a Real Socket Underneath
+        self.sendfile = (use_sendfile and sendfile is not None and
+                         sys.platform.startswith('linux') and
+                         hasattr(transport, 'getHandle'))
+
+        self.done = False
+
+    def start(self):
+
+        '''
+        Registers with the Transport, which then Pulls the Chunks
+        '''
+
+        self.transport.registerProducer(self, False)
+
+    def rewind(self, offset):
+
+        '''
+        Restarts from "offset" after a Nack
+
+          - A Body whose Header is Already Out is still Sent first
+        '''
+
+        self.offset = offset
+
+    def stop(self):
+
+        '''
+        Ends the File after the Chunk in Flight, the Rest isn't Sent
+
+          - A Body whose Header is Already Out goes through the Transport,
+            so Whatever is Written Next Follows it
+        '''
+
+        if self.body is not None:
+            offset, length = self.body
+            self.body = None
+            self.transport.write(self.mm[offset:offset + length])
+
+        self.offset = self.size
+        self.finish()
+
+    def resumeProducing(self):
+
+        '''
+        Called by the Transport when its Buffer has Drained
+
+          - Sends any Waiting Body, then Writes the Next Chunk
+        '''
+
+        # The Header has Gone Out, the Socket is Ours for the Body
+        if self.body is not None:
+            self.sendBody()
+
+        # Finished, Hand the Transport Back
+        if self.offset >= self.size:
+            self.finish()
+            return
+
+        offset = self.offset
+        length = min(self.chunk_size, self.size - offset)
+        self.offset += length
+
+        # Checksum the Mapped Pages Directly
+        crc = zlib.crc32(buffer(self.mm, offset, length)) & 0xffffffff
+
+        header = encodeFrame(CHUNK, {'tid': self.tid,
+                                     'offset': offset,
+                                     'crc': crc},
+                             length)
+
+        # Write the Header Now, the Body goes Straight from the File once
+        # the Header has been Flushed (Keeping the Stream in Order)
+        if self.sendfile:
+            self.transport.write(header)
+            self.body = (offset, length)
+
+        else:
+            self.transport.write(header + self.mm[offset:offset + length])
+
+    def sendBody(self):
+
+        '''
+        Sends the Waiting Body with sendfile
+
+          - Whatever the Socket won't Take Now goes through the Transport
+        '''
+
+        offset, length = self.body
+        self.body = None
+        sent = 0
+
+        try:
+            while sent < length:
+                count = sendfile(self.transport.getHandle().fileno(),
+                                 self.f.fileno(),
+                                 offset + sent,
+                                 length - sent)
+                if not count:
+                    break
+                sent += count
+
+        except OSError as err:
+            if err.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+        # Socket Full, Queue the Remainder Normally
+        if sent < length:
+            self.transport.write(self.mm[offset + sent:offset + length])
+
+    def finish(self):
+
+        '''
+        Unregisters from the Transport & Releases the File
+        '''
+
+        if not self.done:
+            self.done = True
+            self.transport.unregisterProducer()
+            self.stopProducing()
+
+    def stopProducing(self):
+
+        '''
+        Called when the Connection goes away, Releases the File
+        '''
+
+        if not self.f.closed:
+            self.mm.close()
+            self.f.close()
+
+
+class NukeBoxClientProtocol(NukeBoxFrameReceiver):
 
     '''
     B{NukeBox 2000 Client Protocol Class}
 
       - Main Nukebox Client Protocol Object
+      - One Session per Connection, Registers Once
       - Responsible for:
 
-        - File Transfer
+        - File Transfer (every File Pending in the Factory)
+        - Searching the Server's Library & Requesting Tracks from it
     '''
 
-    def __init__(self, factory, fname):
+    def __init__(self, factory):
 
         '''
         Client Protocol constructor method
@@ -33,62 +219,231 @@ class NukeBoxClientProtocol(LineReceiver):
         # Create a Reference to the Parent Factory Class
         self.factory = factory
 
-        # Create the Reference to the File
-        self.fname = fname
-
         # Get the Users Name & Mac ID
         self.name = getpass.getuser()
         self.mac = hex(get_mac())
 
+        # The Chunk Producer for the File in Flight
+        self.producer = None
+
+        # Searches & Requests Awaiting their Answer, by Transfer ID, & the
+        # Results Frame Arriving
+        self.asked = {}
+        self.answer = None
+        self.payload = []
+
     def connectionMade(self):
 
         '''
         Called when a connection is made with the server
 
-          - Determines total file size
-          - Pickles & then sends client info to the server
+          - Sends client info to the server in a Register frame
         '''
 
-        # Get the Size of the File
-        filesize = os.path.getsize(self.fname)
+        print('Sending Client ' + self.name)
 
-        print('Filesize ' + str(filesize))
+        # Send the Gathered Data to the Server
+        self.sendFrame(REGISTER, {'name': self.name,
+                                  'mac_id': self.mac})
 
-        print('Sending Client ' + self.name)
+    def frameReceived(self, msg_type, meta, length):
+
+        '''
+        Called when a frame is received
+
+          - Receives Ready from server, Asks any Searches & Requests &
+            Initiates the First Transfer
+          - Receives Results & Queued from server, the Answers to those
+          - Receives Have from server & Sends the File only if Needed
+          - Receives Nack from server & Resends from the Given Offset
+          - Receives Ack from server & Moves on to the Next File
+          - Receives Error from server & Disconnects
+        '''
+
+        # If the Server Responds with a Request for Transfer, oblige
+        if msg_type == READY:
+            self.askLibrary()
+            self.sendNext()
+
+        # A Page of Search Results, in the Payload
+        elif msg_type == RESULTS:
+            self.answer = meta
+            self.payload = []
+
+        # Whether a Requested Track was Queued
+        elif msg_type == QUEUED:
+            if meta['queued']:
+                print('Queued Track {}'.format(self.asked[meta['tid']][1]))
+            else:
+                print('Track {} is not Available'.format(
+                    self.asked[meta['tid']][1]))
+            self.answered(meta['tid'])
+
+        # The Server Already Stores this Content, Skip the Upload
+        elif msg_type == HAVE and meta['have']:
+            print('Server Has ' + self.factory.pending.pop(0))
+            self.sendNext()
+
+        # Another Guest is Uploading the Same Content Right Now, the Server
+        # Queues it for us too once it Arrives (Sending it is Stopped, if
+        # we had Started Already)
+        elif msg_type == HAVE and meta['busy']:
+            if self.producer is not None and \
+                    self.producer.tid == meta['tid']:
+                self.producer.stop()
+            print('Server is Receiving ' + self.factory.pending.pop(0))
+            self.sendNext()
+
+        # The Server Needs the Content, Send it (or the Rest of it)
+        elif msg_type == HAVE:
+            self.sendFile(meta['tid'], meta['offset'])
+
+        # A Chunk went Missing or was Corrupted, Resend from There
+        elif msg_type == NACK:
+            print('Resending from {}'.format(meta['offset']))
+            self.sendChunks(meta['tid'], meta['offset'])
+
+        # The File in Flight has Arrived, Move on to the Next
+        elif msg_type == ACK:
+            print('Sent ' + self.factory.pending.pop(0))
+            self.sendNext()
+
+        # Drop the Connection to the Server
+        else:
+            if msg_type == ERROR:
+                print('Server Error: ' + meta['reason'])
+                self.factory.refused(meta.get('tid'))
+            self.transport.loseConnection()
 
-        # Serialize the Gathered Data & Send it to the Server
-        self.sendLine(pickle.dumps({"size": filesize,
-                                    "filename": self.fname,
-                                    "name": self.name,
-                                    'mac_id': self.mac}
-                                   ))
+    def sendNext(self):
 
-    def lineReceived(self, data):
+        '''
+        Asks the Server whether it Already Has the Next Pending File
 
+          - Sends the Content Digest in a Query frame
+          - Disconnects once Nothing is left to Send or Ask
         '''
-        Called when a piece of data is received
 
-          - Receives Ack from server
-          - Initiates File Transfer
+        # All Done, End the Session (once the Library has Answered)
+        if not self.factory.pending:
+            if not self.asked:
+                self.transport.loseConnection()
+            return
+
+        fname = self.factory.pending[0]
+
+        # Ask by Content, Not Name, so Renamed Copies are Caught too
+        self.sendFrame(QUERY, {'tid': self.factory.nextTid(),
+                               'hash': self.factory.digest(fname)})
+
+    def askLibrary(self):
+
         '''
+        Sends the Factory's Searches & Track Requests
 
-        # If the Server Responds with a Request for Transfer, oblige
-        if data == 'tx':
+          - Each in a Frame of its own, Answered by Transfer ID
+        '''
 
-            # Open the File
-            f = open(self.fname, "rb")
+        for query in self.factory.searches:
+            tid = self.factory.nextTid()
+            self.asked[tid] = (self.factory.searches, query)
+            self.sendFrame(SEARCH, {'tid': tid,
+                                    'query': query,
+                                    'page': self.factory.page})
 
-            # Read the File Contents and Send them to the Server
-            contents = f.read()
-            self.sendLine(contents)
+        for file_id in self.factory.requests:
+            tid = self.factory.nextTid()
+            self.asked[tid] = (self.factory.requests, file_id)
+            self.sendFrame(REQUEST, {'tid': tid, 'file_id': file_id})
 
-            # Close the File
-            f.close()
+    def payloadReceived(self, data):
 
-        # Drop the Connection to the Server
-        else:
+        '''
+        Collects the Payload of a Results Frame
+        '''
+
+        self.payload.append(data)
+
+    def payloadComplete(self):
+
+        '''
+        Shows a Page of Search Results, each Track with the file_id to
+        Request it by
+        '''
+
+        meta, tracks = self.answer, json.loads(''.join(self.payload))
+        self.answer, self.payload = None, []
+
+        print('Results for "{}", Page {} ({} Matches)'.format(
+            self.asked[meta['tid']][1], meta['page'], meta['total']))
+
+        for track in tracks:
+            print(u'{:>8}  {} - {} ({})'.format(track['file_id'],
+                                                track['artist'],
+                                                track['title'],
+                                                track['album']))
+
+        self.answered(meta['tid'])
+
+    def answered(self, tid):
+
+        '''
+        Forgets an Answered Search or Request
+
+          - Ends the Session once Nothing is left to Send or Ask
+        '''
+
+        items, value = self.asked.pop(tid)
+        items.remove(value)
+
+        if not self.factory.pending and not self.asked:
             self.transport.loseConnection()
 
+    def sendFile(self, tid, offset):
+
+        '''
+        Announces the Next Pending File in a File frame
+
+          - Then Sends its Data from "offset" in Chunk frames
+        '''
+
+        fname = self.factory.pending[0]
+
+        # Get the Size of the File
+        filesize = os.path.getsize(fname)
+
+        print('Filesize ' + str(filesize))
+
+        if offset:
+            print('Resuming from {}'.format(offset))
+
+        self.sendFrame(FILE, {'tid': tid,
+                              'filename': fname,
+                              'size': filesize,
+                              'hash': self.factory.digest(fname)})
+        self.sendChunks(tid, offset)
+
+    def sendChunks(self, tid, offset):
+
+        '''
+        Streams the Pending File from "offset" in Checksummed Chunk frames
+
+          - A Producer Still Running is Rewound rather than Replaced
+        '''
+
+        if self.producer is not None and not self.producer.done:
+            self.producer.rewind(offset)
+            return
+
+        # The Transport Pulls Chunks as its Buffer Drains (Backpressure)
+        self.producer = NukeBoxChunkProducer(self.transport,
+                                             self.factory.pending[0],
+                                             tid,
+                                             offset,
+                                             self.factory.chunk_size,
+                                             self.factory.use_sendfile)
+        self.producer.start()
+
     def connectionLost(self, reason):
 
         '''
@@ -107,22 +462,43 @@ class NukeBoxClientFactory(protocol.ClientFactory):
       - Responsible for:
 
         - Building Client protocols
+        - Tracking the Files still to Send, & the Searches & Requests
+          still to Ask
         - Reconnecting to server
         - Disconnection from server
         - Destroying the reactor
     '''
 
-    def __init__(self, fname):
+    def __init__(self, fnames, chunk_size=262144, use_sendfile=True,
+                 searches=None, requests=None, page=1):
 
         '''
         NukeBoxClient Factory constructor method
+
+          - "searches" are Queries for the Library, "page" the Page of
+            Results Wanted, "requests" the file_ids of Tracks to Queue
         '''
 
         # Create the Factory Instance Variables
         # self.logger = log
-        self.fname = fname
+        self.pending = list(fnames)
         self.host = ''
 
+        # Library Searches & Track Requests still to be Answered
+        self.searches = list(searches or [])
+        self.requests = list(requests or [])
+        self.page = page
+
+        # Bytes per Checksummed Chunk & Whether to Try Zero-Copy Sends
+        self.chunk_size = chunk_size
+        self.use_sendfile = use_sendfile
+
+        # Content Digests, Kept so a Reconnect doesn't Hash Again
+        self.digests = {}
+
+        # Transfer IDs are Unique for the Life of the Factory
+        self.tid = 0
+
     def buildProtocol(self, addr):
 
         '''
@@ -130,7 +506,43 @@ class NukeBoxClientFactory(protocol.ClientFactory):
         '''
 
         # Build an Instance of the Client Protocol
-        return NukeBoxClientProtocol(self, self.fname)
+        return NukeBoxClientProtocol(self)
+
+    def nextTid(self):
+
+        '''
+        Returns a Fresh Transfer ID
+        '''
+
+        self.tid += 1
+        return self.tid
+
+    def digest(self, fname):
+
+        '''
+        Returns the Content Digest of a Pending File
+        '''
+
+        if fname not in self.digests:
+            self.digests[fname] = hashFile(fname)
+        return self.digests[fname]
+
+    def refused(self, tid):
+
+        '''
+        Called when the Server Refuses a Transfer or the Session
+
+          - A Refused File is Dropped, the rest are Retried
+          - Refusing the Session itself Abandons every File, Search &
+            Request
+        '''
+
+        if tid is None:
+            del self.pending[:]
+            del self.searches[:]
+            del self.requests[:]
+        elif self.pending:
+            print('Skipping ' + self.pending.pop(0))
 
     def clientConnectionFailed(self, connector, reason):
 
@@ -144,11 +556,17 @@ class NukeBoxClientFactory(protocol.ClientFactory):
     def clientConnectionLost(self, connector, reason):
 
         '''
-        Lost Connections are Discarded
+        Lost Connections are Discarded Once Every File is Sent
 
-          - Stops the Reactor Loop
+          - Reconnects while Files, Searches or Requests are still Pending
+          - Otherwise Stops the Reactor Loop
         '''
 
+        # Pick up Where we Left Off
+        if self.pending or self.searches or self.requests:
+            connector.connect()
+            return
+
         # Call Disconnect method on the Transport obj & Stop the reactor
         connector.disconnect()
         reactor.stop()
@@ -210,15 +628,54 @@ class NukeBoxClientBroadcastProtocol(protocol.DatagramProtocol):
           - Uses the Responders address to make TCP Connection
         '''
 
+        # Only the First Response Counts, Discovery Happens Once per Session
+        if self.factory.host:
+            return
+
         # Pull the Server IP Address from the Response & Make the Connection
         self.factory.host = ip
         reactor.connectTCP(ip, 8008, self.factory)
 
+        # Stop Listening, the Session Reuses this one Connection
+        self.transport.stopListening()
+
+
+def collect(paths):
+
+    '''
+    Expands the Given Paths into a List of Files to Send
+
+      - Directories (e.g. an Album Folder) contribute every File inside
+      - Empty Files are Skipped
+    '''
+
+    fnames = []
+
+    for path in paths:
+
+        # Take every File in a Folder, in Track Order
+        if os.path.isdir(path):
+            found = sorted(os.path.join(path, name)
+                           for name in os.listdir(path))
+        else:
+            found = [path]
+
+        for fname in found:
+            if os.path.isfile(fname) and os.path.getsize(fname) > 0:
+                fnames.append(fname)
+            else:
+                print('Skipping {}, File has No Content! :( '.format(fname))
+
+    return fnames
+
 
 def main():
 
     '''
     Main test function
+
+      - Sends every File or Folder named on the Command Line
+      - Searches the Library (-s) & Queues Tracks from it by file_id (-r)
     '''
 
     # This section is only for logging stuff
@@ -234,13 +691,29 @@ def main():
     # Invalid File Format
     # fname = "jukebox_client.log"
 
-    filesize = os.path.getsize(fname)
-    if filesize == 0:
-
-        print('File has No Content! :( ')
+    parser = argparse.ArgumentParser(
+        description='Send tracks to a NukeBox server, or find them there')
+    parser.add_argument('paths', nargs='*', metavar='PATH',
+                        help='file or folder to send')
+    parser.add_argument('-s', '--search', action='append', default=[],
+                        metavar='QUERY', help='search the library')
+    parser.add_argument('-p', '--page', type=int, default=1,
+                        help='page of search results (default 1)')
+    parser.add_argument('-r', '--request', action='append', default=[],
+                        type=int, metavar='FILE_ID',
+                        help='queue a track found by a search')
+    args = parser.parse_args()
+
+    asking = args.search or args.request
+
+    fnames = collect(args.paths or ([] if asking else [fname]))
+    if not fnames and not asking:
+
+        print('Nothing to Send! :( ')
         os._exit(1)
 
-    factory = NukeBoxClientFactory(fname)
+    factory = NukeBoxClientFactory(fnames, searches=args.search,
+                                   requests=args.request, page=args.page)
 
     print('*** Client Running ***')
 
@@ -251,4 +724,3 @@ def main():
 # this only runs if the module was *not* imported
 if __name__ == '__main__':
     main()
-
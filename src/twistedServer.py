@@ -2,35 +2,120 @@
 
 from twisted.internet import reactor, protocol, defer
 from twisted.internet.threads import deferToThread
-from twisted.protocols.basic import LineReceiver
 
 import os
 import re
 import sys
-import pickle
+import json
+import zlib
 import signal
-import subprocess
+import functools
 from shutil import move
-from mutagen.id3 import ID3
-from StringIO import StringIO
 from socket import SOL_SOCKET, SO_BROADCAST
 
-from NukeBoxDB import NukeBoxQuery
+from NukeBoxAsyncDB import NukeBoxAsyncDB
+from NukeBoxConfig import config
 from NukeBoxQueue import NukeBoxQueue
+from NukeBoxJournal import NukeBoxJournal
+from NukeBoxPlayer import NukeBoxPlayer, makeSink
+from NukeBoxIngest import NukeBoxIngest, NukeBoxIndex, hashFile
+from NukeBoxMeta import NukeBoxSniffer, MetaError, readTags
+from NukeBoxLoudness import NukeBoxLoudness
+from NukeBoxTranscode import NukeBoxTranscode, playable
+from NukeBoxAdmission import NukeBoxAdmission
+from NukeBoxFrame import NukeBoxFrameReceiver, REGISTER, READY, FILE, ACK, \
+    ERROR, QUERY, HAVE, CHUNK, NACK, SEARCH, RESULTS, REQUEST, QUEUED
 
+# Most Search Results Sent in one Frame
+MAX_PER_PAGE = 100
 
-class NukeBoxProtocol(LineReceiver):
+# How Paths are Held in Queue Entries (Bytes) & the DB (unicode)
+FS_ENCODING = sys.getfilesystemencoding() or 'utf-8'
+
+
+def fsPath(path):
+
+    '''
+    Returns a Path as the Filesystem's Bytes, the Way Queue Entries Hold
+    it, whether it came from the DB (unicode) or the Disk
+    '''
+
+    if isinstance(path, unicode):
+        return path.encode(FS_ENCODING)
+    return path
+
+
+class NukeBoxTransfer(object):
+
+    '''
+    B{NukeBox 2000 Transfer Class}
+
+      - State for a Single File Transfer within a Client Session
+      - Responsible for:
+
+        - Holding the File Details announced by the Client
+        - Holding the Temp & Destination Paths
+        - Sniffing the First Bytes to Check it is Audio
+        - Holding the Tags found during Validation
+    '''
+
+    def __init__(self, tid, fname, size, claimed, name):
+
+        '''
+        Transfer Constructor
+        '''
+
+        # Transfer ID (Unique within the Session), Filename & Size
+        self.tid = tid
+        self.fname = fname
+        self.size = size
+
+        # The Digest the Client Claims, Checked once Every Byte Arrives, &
+        # the Partial Upload Name in the Temp Directory (from that Claim)
+        self.claimed = claimed
+        self.name = name
+
+        # Set the Initial Percent, Ingest File, Offset Index & Paths
+        self.oldPercent = 0
+        self.ingest = None
+        self.index = None
+        self.temp_f_name = None
+        self.dst = None
+
+        # The Client was told to Resend, ignore Chunks until it does
+        self.nacked = False
+
+        # Checks the Head of the Upload is Audio as it Arrives
+        self.sniffer = NukeBoxSniffer()
+
+        # Content Digest & Whether the Content was Already Stored
+        self.digest = None
+        self.duplicate = False
+
+        # Format, Tags & DB Row, Filled in by the Callback Chain
+        self.filetype = None
+        self.artist = None
+        self.title = None
+        self.album = None
+        self.genre = None
+        self.duration = None
+        self.file = None
+
+
+class NukeBoxProtocol(NukeBoxFrameReceiver):
 
     '''
     B{NukeBox 2000 Protocol Class}
 
       - Main Nukebox Protocol Object
+      - One Long-Lived Session per Client Connection
       - Responsible for:
 
-        - File Transfer
+        - File Transfer (many Files per Session)
         - DB Access
         - Queuing
         - Error Checking
+        - Waiting its Turn & Keeping to its Rate (see NukeBoxAdmission)
     '''
 
     def __init__(self, factory):
@@ -47,13 +132,36 @@ class NukeBoxProtocol(LineReceiver):
         # Set the Users State to New
         self.state = 'New'
 
-        # Set the Initial Total File Size & Percent Variables
-        self.sizeTotal = 0
-        self.oldPercent = 0
+        # Set the Intial State of the Client
+        self.client = None
+        self.mac_id = None
+        self.user = None
+
+        # The Transfer Currently Streaming & all those Still in Progress
+        self.current = None
+        self.transfers = {}
+
+        # Checksum State for the Chunk Currently Arriving
+        self.chunk_crc = 0
+        self.chunk_expected = None
+        self.skipping = False
+
+        # The Part of the Chunk the Sniffer Needs, Held until it's Verified,
+        # & where that Starts in the Upload
+        self.sniffed = []
+        self.sniffed_at = None
 
-        # Set the Intial State of the Buffer & Filename
-        self.buffer = None
-        self.fname = None
+        # Why Reading from the Client is Paused ('admission', 'rate'), the
+        # Call Lifting the Rate Limit & the Client's Bucket (if Limited)
+        self.holds = set()
+        self.throttled = None
+        self.bucket = factory.admission.bucket()
+
+        # The Transfer Waiting for Room on the Server
+        self.waiting = None
+
+        # Transfers Answered Busy, whose Chunks (Already Sent) are Skipped
+        self.dropped = set()
 
     def connectionMade(self):
 
@@ -70,6 +178,34 @@ class NukeBoxProtocol(LineReceiver):
         Called when the Server loses a connection
         '''
 
+        # Transfers Cut Short Keep their Committed Part for Resuming, those
+        # Complete are Validating & Free their Place once Done
+        for transfer in list(self.transfers.values()):
+            if self.factory.uploads.get(transfer.name) is not transfer:
+                continue
+
+            print('Transfer Incomplete, Keeping {} Bytes for Resume'.format(
+                transfer.ingest.committed))
+            transfer.ingest.close()
+            del self.transfers[transfer.tid]
+            del self.factory.uploads[transfer.name]
+            self.factory.admission.release(transfer)
+
+        self.current = None
+
+        # Any DB Queries Still Running must not Revive the Session
+        self.state = 'Gone'
+
+        # Give up our Place (or our Place in Line) to the Next Client
+        if self.waiting is not None:
+            self.factory.admission.release(self.waiting)
+            self.waiting = None
+        self.factory.admission.unregister(self)
+
+        if self.throttled is not None:
+            self.throttled.cancel()
+            self.throttled = None
+
         # If the user exists in the user dictionary, remove the value
         # associated with them
         if self.client in self.factory.clients:
@@ -77,88 +213,616 @@ class NukeBoxProtocol(LineReceiver):
         else:
             'Not in dict'
 
-    def lineReceived(self, data):
+    def frameReceived(self, msg_type, meta, length):
 
         '''
-        Directs new user instances to the Register method
+        Directs each Frame according to its Type & the User State
+
+          - Register Frames from New users go to the Register method
+          - Query Frames ask whether a File is Already Stored
+          - File Frames from Registered users start a Transfer
+          - Chunk Frames carry the File data for the Current Transfer
+          - Search Frames look through the Library, Request Frames Queue
+            a Track Found that Way
+          - Anything else is refused & the Connection dropped
         '''
 
         # If this is a New User, send them to Register
-        # May not be needed in the final implementation
-        if self.state == 'New':
-            self.register(data)
+        if msg_type == REGISTER and self.state == 'New':
+            self.register(meta)
+
+        # Does the Server Already Have this Content?
+        elif msg_type == QUERY and self.state == 'Reg':
+            self.haveFile(meta)
+
+        # If the User is Registered, Start Receiving the File
+        elif msg_type == FILE and self.state == 'Reg':
+            self.receiveFile(meta, length)
+
+        # Left to Another Session, the Client Stops Sending it
+        elif msg_type == CHUNK and meta['tid'] in self.dropped:
+            self.skipping = length > 0
+
+        # The Next Piece of the Current File
+        elif msg_type == CHUNK and self.current is not None:
+            self.receiveChunk(meta, length)
 
-    def register(self, data):
+        # Search the Library, or Queue a Track from it
+        elif msg_type == SEARCH and self.state == 'Reg':
+            self.searchLibrary(meta)
 
+        elif msg_type == REQUEST and self.state == 'Reg':
+            self.requestFile(meta)
+
+        else:
+            self.refuse('Unexpected Frame Type {}'.format(msg_type))
+
+    def refuse(self, reason, tid=None):
+
+        '''
+        Notifies the Client of an Error & Drops the Connection
         '''
-        Registers New Clients
 
-        - Deconstructs Data
-        - Adds User Entry to DB
-        - Sets the User Instance State
-        - Initiates File Transfer from Client
+        print('Refusing Client: ' + reason)
+        self.sendFrame(ERROR, {'reason': reason, 'tid': tid})
+        self.transport.loseConnection()
+
+    def hold(self, reason):
+
+        '''
+        Stops Reading from the Client, until every Hold is Lifted
+
+          - The Client's Sends Back Up, so it Slows Down too
         '''
 
-        # Pull the Data apart for the contained info
-        obj = pickle.loads(data)
-        self.sizeTotal = obj["size"]
+        if not self.holds:
+            self.transport.pauseProducing()
+        self.holds.add(reason)
 
-        self.fname = obj["filename"]
-        self.fname = self.fname.split('/')
-        self.fname = self.fname[-1]
+    def unhold(self, reason):
+
+        '''
+        Lifts a Hold, Reading Carries on once None are Left
+        '''
 
-        self.client = obj["name"]
-        self.mac_id = obj['mac_id']
+        self.holds.discard(reason)
+        if not self.holds and self.state != 'Gone':
+            self.transport.resumeProducing()
 
-        print('The Filesize Server Side is ' + str(self.sizeTotal))
+    def throttle(self, size):
+
+        '''
+        Spends "size" Bytes of the Client's Rate, Stops Reading from it
+        for a While if it has Overspent
+        '''
+
+        delay = self.bucket.take(size)
+        if delay and self.throttled is None:
+            self.hold('rate')
+            self.throttled = reactor.callLater(delay, self.unthrottle)
+
+    def unthrottle(self):
+
+        '''
+        Reads from a Rate Limited Client again
+        '''
+
+        self.throttled = None
+        self.unhold('rate')
+
+    def register(self, meta):
+
+        '''
+        Registers New Clients, Once per Session
+
+        - Deconstructs the Metadata
+        - Waits its Turn if the Server has too many Sessions
+        - CreateUser Adds the DB Entry & Registered Invokes the Rest
+        '''
+
+        # Pull the Metadata apart for the contained info
+        self.client = meta['name']
+        self.mac_id = meta['mac_id']
 
         print('Received ' + self.client)
 
+        # No more Register Frames while Waiting & while the DB is Working
+        self.state = 'Registering'
+
+        # Granted from within Another Session's Callbacks, so Carry on
+        # from the Reactor instead
+        granted = functools.partial(reactor.callLater, 0, self.createUser)
+
+        if self.factory.admission.register(self, granted):
+            self.createUser()
+        else:
+            print('Server Busy, {} Waits to Register'.format(self.client))
+
+    def createUser(self):
+
+        '''
+        Adds the User Entry to the DB (off the Reactor Thread)
+        '''
+
+        # Dropped while Waiting its Turn
+        if self.state == 'Gone':
+            return
+
         # Create a Dict obj for the new DB User entry
         user_details = {'Model': 'Users',
                         'name': self.client,
                         'mac_id': self.mac_id
                         }
 
-        # Use 'With' so instance is garbage collected
-        with NukeBoxQuery() as nbq:
-            user = nbq.create(user_details)
+        d = self.factory.db.create(user_details)
+        d.addCallbacks(self.registered, self.dbError)
+
+    def registered(self, user):
+
+        '''
+        Completes Registration with the User's DB Entry
+
+        - Sets the User Instance State
+        - Tells the Client to Start Sending Files
+        '''
+
+        # The Client may have Gone while the DB was Working
+        if self.state == 'Gone':
+            return
 
-        # Store the user object in the Factory Clients dict
+        # Store the user object in the Factory Clients dict, and Keep our
+        # Own Reference for Chains that Finish after we Disconnect
         self.factory.clients[self.client] = user
+        self.user = user
 
         # Set the User Sate to Registered
         self.state = 'Reg'
 
-        # Notify the Client that we're Ready for Transfer
-        self.sendLine('tx')
+        # Notify the Client that we're Ready for Transfers
+        self.sendFrame(READY)
+
+    def dbError(self, failure):
+
+        '''
+        Reports a Failed DB Query to the Client & Drops the Connection
+        '''
+
+        print('DB Error: {}'.format(failure.getErrorMessage()))
+        if self.state != 'Gone':
+            self.refuse('Database Unavailable')
 
-        # Set the Ingress Mode to Raw & Create a buffer obj
-        self.setRawMode()
-        self.buffer = StringIO()
+    def lookupHash(self, digest):
 
-    def rawDataReceived(self, data):
+        '''
+        Looks up the Files Row Storing the Given Content
+
+          - Returns a Deferred Firing with the Row, or None
+        '''
 
+        d = self.factory.db.read(**{'Model': 'Files', 'hash': digest})
+        d.addErrback(self.noResult)
+        return d
+
+    def noResult(self, failure):
+
+        '''
+        Turns a Read that Matched Nothing into None
         '''
-        Receives the Raw File data
+
+        # Imported Here, SQLAlchemy is Loaded by the DB Threads
+        from sqlalchemy.orm.exc import NoResultFound
+
+        failure.trap(NoResultFound)
+        return None
+
+    def haveFile(self, meta):
+
+        '''
+        Answers a Client asking whether we Already Have some Content
+
+        - Looks up the Content Hash off the Reactor Thread
+        - Have Replies Once the Lookup Completes
+        '''
+
+        d = self.lookupHash(meta['hash'])
+        d.addCallback(self.have, meta)
+        d.addErrback(self.dbError)
+
+    def have(self, row, meta):
+
+        '''
+        Replies to a Query with the Result of the Hash Lookup
+
+        - Queues the Stored Copy for this User when we Do
+        - The Client Skips the Upload Entirely
+        - Content Another Session is Uploading is Queued for this User
+          too, once it Arrives
+        - Otherwise Reports the Offset to Resume a Partial Upload from
+        '''
+
+        if self.state == 'Gone':
+            return
+
+        have = row is not None and os.path.isfile(row.path)
+        name = self.partName(meta['hash'])
+
+        reply = {'tid': meta['tid'],
+                 'have': have,
+                 'busy': name in self.factory.uploads,
+                 'offset': 0
+                 }
+
+        if have:
+            print('Already Have ' + row.path)
+            self.queuePath(row.path)
+
+        elif reply['busy']:
+            self.addGuest(name)
+
+        # Tell the Client how much of an Earlier Attempt we Kept
+        else:
+            reply['offset'] = self.resumeOffset(name)
+
+        self.sendFrame(HAVE, reply)
+
+    def addGuest(self, name):
+
+        '''
+        Remembers this User Wants a Partial Upload, Queued for them once
+        Whichever Session Finishes it does (see moveFile)
+        '''
+
+        guests = self.factory.guests.setdefault(name, [])
+        if self.mac_id not in guests:
+            print('Queuing for {} once it Arrives'.format(self.client))
+            guests.append(self.mac_id)
+
+    def searchLibrary(self, meta):
+
+        '''
+        Searches the Library by Title, Artist, Album & Genre
+
+        - Runs off the Reactor Thread, see NukeBoxQuery.search
+        - Results Replies Once the Search Completes
+        '''
+
+        per_page = min(meta.get('per_page') or 20, MAX_PER_PAGE)
+
+        d = self.factory.db.search(meta['query'], meta.get('page') or 1,
+                                   per_page)
+        d.addCallback(self.results, meta)
+        d.addErrback(self.dbError)
+
+    def results(self, found, meta):
+
+        '''
+        Replies to a Search with a Page of Matches
+
+        - The Page is a JSON List in the Payload, each Track a Dict of
+          file_id, title, artist, album & genre
+        '''
+
+        if self.state == 'Gone':
+            return
+
+        reply = {'tid': meta.get('tid'),
+                 'total': found['total'],
+                 'page': found['page']
+                 }
+
+        self.sendFrame(RESULTS, reply, json.dumps(found['results']))
+
+    def requestFile(self, meta):
+
+        '''
+        Queues a Library Track, by its file_id, for this User
+        '''
+
+        d = self.factory.db.read(**{'Model': 'Files',
+                                    'file_id': meta['file_id']})
+        d.addErrback(self.noResult)
+        d.addCallback(self.requested, meta)
+        d.addErrback(self.dbError)
+
+    def requested(self, row, meta):
+
+        '''
+        Replies to a Request, Telling the Client whether it was Queued
+        '''
+
+        if self.state == 'Gone':
+            return
+
+        queued = row is not None and os.path.isfile(row.path)
+        if queued:
+            self.queuePath(row.path)
+
+        self.sendFrame(QUEUED, {'tid': meta.get('tid'), 'queued': queued})
+
+    def partName(self, digest):
+
+        '''
+        Returns the Temp Directory Name for a Partial Upload
+
+          - Keyed on the Client's Digest so any Session can Resume it
+        '''
+
+        return re.sub('[^\w]', '-', digest)
+
+    def resumeOffset(self, name):
+
+        '''
+        Returns the Committed Offset of a Partial Upload
+
+          - An Index Pointing Past the End of the Data is Discarded
+        '''
+
+        part = self.factory.temp + name + '.part'
+        index = NukeBoxIndex(self.factory.temp + name + '.idx')
+        offset = index.committed()
+
+        if offset and (not os.path.isfile(part) or
+                       os.path.getsize(part) < offset):
+            index.remove()
+            return 0
+
+        return offset
+
+    def queuePath(self, path, mac_id=None):
+
+        '''
+        Adds a Stored File to the Queuing System for this User (or the
+        User Given)
+        '''
+
+        # Create a String with the Users Mac ID & File Path, as Bytes (e.g.
+        # Imported Paths come from the DB as unicode)
+        mac_id = mac_id or self.mac_id
+        if isinstance(mac_id, unicode):
+            mac_id = mac_id.encode('utf-8')
+
+        path = fsPath(path)
+        user_path = mac_id + ':' + path
+
+        # If this String Does Not Exist in the Queue
+        if user_path not in self.factory.q:
+
+            print('Path not already Queued!\n'
+                  'Adding ....')
+
+            # Add Path to the Queue System
+            self.factory.q.append(user_path)
+            print('Added! :) ')
+
+        # Have it Transcoded, if Transcoding is Enabled
+        self.factory.transcode(path)
+
+        # Have its Gain Ready for the Player
+        self.factory.lookupGain(path)
+
+    def receiveFile(self, meta, length):
+
+        '''
+        Announces a Transfer within the Session
+
+        - Refuses Files the Server could never Take
+        - Starts the Transfer Now, or Stops Reading from the Client until
+          the Server has Room for it (see NukeBoxAdmission)
+        - The Data follows in Chunk Frames
+        '''
+
+        # Pull the File Details from the Metadata
+        tid = meta['tid']
+        fname = meta['filename'].split('/')[-1]
+        size = meta['size']
+        name = self.partName(meta['hash'])
+
+        print('The Filesize Server Side is ' + str(size))
+
+        # The File Frame only Announces the Transfer
+        if length != 0:
+            self.refuse('Unexpected File Payload', tid)
+            return
+
+        # Empty Files have no Chunks to Complete
+        if size == 0:
+            self.refuse('File has No Content', tid)
+            return
+
+        # Transfer IDs Must be Unique within the Session
+        if tid in self.transfers:
+            self.refuse('Duplicate Transfer', tid)
+            return
+
+        # One File at a Time, the Next Follows its Ack
+        if self.current is not None or self.waiting is not None:
+            self.refuse('Transfer in Progress', tid)
+            return
+
+        # Too Large for the Server's Limits or its Disk
+        reason = self.factory.admission.check(size)
+        if reason is not None:
+            self.refuse(reason, tid)
+            return
+
+        transfer = NukeBoxTransfer(tid, fname, size, meta['hash'], name)
+
+        # Granted from within Another Session's Callbacks, so Carry on
+        # from the Reactor instead
+        granted = functools.partial(reactor.callLater, 0, self.admitted,
+                                    transfer)
+
+        if self.factory.admission.admit(transfer, size, granted):
+            self.startFile(transfer)
+            return
+
+        # Hold the Chunks (& Everything after them) until it's our Turn
+        print('Server Busy, {} Waits its Turn'.format(fname))
+        self.waiting = transfer
+        self.pauseFrames()
+        self.hold('admission')
+
+    def admitted(self, transfer):
+
+        '''
+        Starts a Transfer that Waited its Turn, then Reads on
+
+        - The Disk may have Filled while it Waited
+        '''
+
+        # Dropped while Waiting, connectionLost Gave its Place up
+        if self.state == 'Gone':
+            return
+
+        self.waiting = None
+
+        reason = self.factory.admission.check(transfer.size, transfer)
+        if reason is not None:
+            self.factory.admission.release(transfer)
+            self.refuse(reason, transfer.tid)
+        else:
+            self.startFile(transfer)
+
+        self.unhold('admission')
+        self.resumeFrames()
+
+    def startFile(self, transfer):
+
+        '''
+        Starts (or Resumes) an Admitted Transfer
+
+        - Opens the Partial Temp File at its Committed Offset
+        - Content Another Session Started Uploading Meanwhile is Left to
+          it & Queued for this User too, as if Queried (see have)
+        '''
+
+        tid, size, name = transfer.tid, transfer.size, transfer.name
+
+        # Only One Session may Write a Partial Upload at a Time
+        if name in self.factory.uploads:
+            self.factory.admission.release(transfer)
+            self.addGuest(name)
+            self.dropped.add(tid)
+            self.sendFrame(HAVE, {'tid': tid,
+                                  'have': False,
+                                  'busy': True,
+                                  'offset': 0})
+            return
+
+        # Create the Path to the Sandboxed Copy of the File & its Index
+        transfer.temp_f_name = self.factory.temp + name + '.part'
+        transfer.index = NukeBoxIndex(self.factory.temp + name + '.idx')
+
+        # Stream the Data to the Temp File, after any Committed Part
+        transfer.ingest = NukeBoxIngest(transfer.temp_f_name,
+                                        size,
+                                        self.factory.write_buffer,
+                                        self.factory.preallocate,
+                                        self.resumeOffset(name))
+
+        self.transfers[tid] = transfer
+        self.factory.uploads[name] = transfer
+        self.current = transfer
+
+        # The Committed Part (All of it, if Preallocated) is on the Disk
+        self.factory.admission.wrote(transfer, transfer.ingest.allocated())
+
+        # A Resumed Upload's Head Arrived Last Time, Sniff it from Disk
+        if transfer.ingest.committed and not self.sniff(transfer):
+            return
+
+        # Nothing Left to Send? (Everything was Committed Last Time)
+        if transfer.ingest.committed >= size:
+            self.finishFile(transfer)
+
+    def receiveChunk(self, meta, length):
+
+        '''
+        Prepares to Receive one Chunk of the Current Transfer
+
+        - Chunks must Start at the Committed Offset
+        - Anything Else is Skipped & the Client told where to Resend from
+        - Chunks over the Size Limit are Refused, the Committed Part is
+          Kept for Resuming
+        '''
+
+        transfer = self.current
+        offset = transfer.ingest.committed
+
+        if length > self.factory.admission.max_chunk:
+            self.refuse('Chunk too Large', transfer.tid)
+            return
+
+        # Out of Place (e.g. Sent before our Nack arrived), Skip it
+        if (meta['tid'] != transfer.tid or meta['offset'] != offset or
+                offset + length > transfer.size):
+            self.skipping = length > 0
+            self.nack(transfer)
+            return
+
+        transfer.nacked = False
+        self.skipping = False
+        self.chunk_crc = 0
+        self.chunk_expected = meta['crc']
+        self.sniffed = []
+        self.sniffed_at = None
+
+    def nack(self, transfer):
+
+        '''
+        Asks the Client to Resend from the Committed Offset
+
+          - Sent Once, until a Chunk at the Right Offset Arrives
+        '''
+
+        if not transfer.nacked:
+            transfer.nacked = True
+            self.sendFrame(NACK, {'tid': transfer.tid,
+                                  'offset': transfer.ingest.committed})
+
+    def payloadReceived(self, data):
+
+        '''
+        Receives the File data
 
         - Outputs Transfer to stdout
-        - Writes Data to Temp File
-        - Calls Validate and Tests the Result
-        - Sends Ack to Client
+        - Streams Data to the Temp File (bounded write-behind)
+        - Checksums the Chunk as it Arrives
+        - Holds what the Sniffer Needs of it, until the Upload Looks like
+          Audio
+        - Keeps the Client to its Rate
         '''
 
-        # Write the Ingress Data to the Buffer obj
-        self.buffer.write(data)
+        if self.bucket is not None:
+            self.throttle(len(data))
+
+        if self.skipping:
+            return
+
+        transfer = self.current
+
+        # Only the Bytes in the Sniffer's Window, not Every Byte until it
+        # Decides (the Tag before the Window may be Large)
+        if not transfer.sniffer.done:
+            at, kept = transfer.sniffer.clip(transfer.ingest.received, data)
+            if kept:
+                if self.sniffed_at is None:
+                    self.sniffed_at = at
+                self.sniffed.append(kept)
+
+        # Write the Ingress Data to the Temp File
+        transfer.ingest.write(data)
+        self.chunk_crc = zlib.crc32(data, self.chunk_crc)
+        self.factory.admission.wrote(transfer, transfer.ingest.allocated())
 
         # Calculate the Overall Percent of the File Received
-        percent = self.buffer.len * 100/self.sizeTotal
+        percent = transfer.ingest.received * 100/transfer.size
 
         # # Solely for Displaying Progress of File Tx.
-        if self.oldPercent != percent:
+        if transfer.oldPercent != percent:
 
             # Increase the oldPercent by what has been Received
-            self.oldPercent = percent
+            transfer.oldPercent = percent
 
             # The Next 4 lines are just for the Progress Bar
             # Flush the Displayed Output
@@ -171,149 +835,343 @@ class NukeBoxProtocol(LineReceiver):
         # Flush the Output again
         sys.stdout.flush()
 
-        # Allow for a little Over-run on the File Transfer
-        if percent >= 100:
+    def payloadComplete(self):
+
+        '''
+        Called once Exactly the Announced Chunk Length has Arrived
+
+        - Commits the Chunk if its Checksum Matches, else Rewinds & Nacks
+        - Sniffs the Verified Chunk, Aborting the Upload if Not Audio
+        - Finishes the File once Every Byte is Committed
+        '''
+
+        if self.skipping:
+            self.skipping = False
+            return
+
+        transfer = self.current
+        crc = self.chunk_crc & 0xffffffff
+
+        # Corrupted in Transit, Throw the Chunk Away & ask for it Again
+        if crc != self.chunk_expected:
+            print('Checksum Mismatch at {}, Requesting Resend'.format(
+                transfer.ingest.committed))
+            transfer.ingest.rewind()
+            self.factory.admission.wrote(transfer, transfer.ingest.allocated())
+            self.nack(transfer)
+            return
+
+        # Record the Verified Chunk so a Dropped Client can Resume
+        transfer.index.append(transfer.ingest.commit(), crc)
+
+        # Stop Non-Audio as Early as we Can Tell
+        if not transfer.sniffer.done:
+            data, self.sniffed = ''.join(self.sniffed), []
+            at, self.sniffed_at = self.sniffed_at, None
+            if not self.sniff(transfer, data, at):
+                return
+
+        if transfer.ingest.committed >= transfer.size:
+            self.finishFile(transfer)
+
+    def sniff(self, transfer, data=None, at=None):
+
+        '''
+        Checks the Head of an Upload is Audio, as it Arrives
+
+        - Sniffs the Data, or the Committed Part of the Temp File
+        - Decides on what Arrived once Every Byte Has
+        - Rejects the Upload if it is Not Audio, Returning False
+        '''
+
+        sniffer = transfer.sniffer
+
+        try:
+            if data is None:
+                sniffer.feedFile(transfer.temp_f_name,
+                                 transfer.ingest.committed)
+            else:
+                sniffer.feed(data, at)
+
+            if transfer.ingest.committed >= transfer.size:
+                sniffer.finish()
+
+        except MetaError as err:
+            self.rejectFile(transfer, str(err))
+            return False
+
+        return True
+
+    def rejectFile(self, transfer, reason):
+
+        '''
+        Aborts an Upload that is Not Audio
+
+        - Removes the Temp File & its Index, Nothing can be Resumed
+        - Refuses the Transfer, the Client Skips the File
+        - Forgets the Guests Waiting for it
+        '''
+
+        print('Rejecting {}: {}'.format(transfer.fname, reason))
+
+        self.current = None
+        del self.factory.uploads[transfer.name]
+        self.factory.guests.pop(transfer.name, None)
+        del self.transfers[transfer.tid]
+        self.factory.admission.release(transfer)
+
+        transfer.ingest.abort()
+        transfer.index.remove()
+
+        self.refuse(reason, transfer.tid)
+
+    def finishFile(self, transfer):
+
+        '''
+        Called once Every Byte of the File is Committed
+
+        - Checks the Content is what the Client Claimed
+        - Calls Validate and Tests the Result
+        - The Transfer Keeps its Place until it is Stored (or Dropped)
+        '''
+
+        self.current = None
+        del self.factory.uploads[transfer.name]
+
+        # Flush the Remaining Data, Close the Temp File & Drop the Index
+        transfer.ingest.close()
+        transfer.index.remove()
+        sys.stdout.write('\n')
+
+        # A Resumed Upload has no Stream Hash, Hash the File off the Reactor
+        digest = transfer.ingest.digest()
+        if digest is None:
+            d = deferToThread(hashFile, transfer.temp_f_name)
+        else:
+            d = defer.succeed(digest)
+        d.addCallback(self.checkDigest, transfer)
+        d.addBoth(self.transferDone, transfer)
+
+    def checkDigest(self, digest, transfer):
+
+        '''
+        Compares the Content's Digest with the one the Client Claimed
+
+        - Sends Ack to Client & Starts the Chain if they Match
+        - Otherwise the Part was Named for Other Content (e.g. a Bad
+          Claim, or a Resume onto Someone Else's Head), it is Deleted &
+          the Transfer Refused
+        '''
+
+        if digest != transfer.claimed:
+            print('Rejecting {}: Content does not Match its Hash'.format(
+                transfer.fname))
+
+            os.remove(transfer.temp_f_name)
+            self.transfers.pop(transfer.tid, None)
+            self.factory.guests.pop(transfer.name, None)
+
+            if self.state != 'Gone':
+                self.refuse('Content does not Match its Hash', transfer.tid)
+            return
+
+        # Notify the Client when the Full File is Received
+        if self.state != 'Gone':
+            self.sendFrame(ACK, {'tid': transfer.tid})
 
-            # Create the Path to the Sandboxed Copy of the File
-            self.temp_f_name = self.factory.temp + self.fname
+        return self.startChain(digest, transfer)
 
-            # Open the Temp File & Write the Data from the Buffer
-            f = open(self.temp_f_name, 'w+')
+    def transferDone(self, result, transfer):
 
-            # Writing File from Buffer
-            print('Writing File from Buffer')
-            f.write(self.buffer.getvalue())
-            print('Finished Writing File from Buffer')
+        '''
+        Frees the Transfer's Place for the Next Upload
+        '''
 
-            # Close the Buffer obj
-            self.buffer.close()
+        self.factory.admission.release(transfer)
+        return result
 
-            # Notify the Client when the Full File is Received
-            sys.stdout.write('\n')
-            self.sendLine('Ack')
+    def startChain(self, digest, transfer):
 
-            # Validate the File
-            d = defer.Deferred()
-            result = self.validateFile(self.temp_f_name, d)
-            # d.addCallback(self.validateFile)
-            d.addCallback(self.queueFile)
-            d.addCallbacks(self.moveFile, self.invalidFile)
+        '''
+        Starts the Validate, Queue & Move Callback Chain
+        '''
 
-    def validateFile(self, path, d):
+        transfer.digest = digest
+
+        # Validate the File
+        d = self.validateFile(transfer)
+        d.addCallback(self.queueFile)
+        d.addCallbacks(self.moveFile, self.invalidFile,
+                       errbackArgs=(transfer,))
+        return d
+
+    def validateFile(self, transfer):
 
         '''
         File Validation Method
 
+        - Reads the Tags & Length off the Reactor Thread, see readTags
+        - Uses the Format the Sniffer Found & Falls Back on the Name the
+          Client Gave for Untagged Files
+        - Returns a Deferred, Tags Read Continues with the Result
         - Invokes the Queue File or Invalid File methods
-        - Temp validation using id3 tags
         '''
-        # d = defer.Deferred()
 
-        try:
-            audio = ID3(path)
-            self.artist = audio['TPE1'].text[0]
-            title = audio["TIT2"].text[0]
-            title = title.split('/')
-            self.title = title[-1]
+        d = deferToThread(readTags, transfer.temp_f_name,
+                          transfer.sniffer.format, transfer.fname)
+        d.addCallback(self.tagsRead, transfer)
+        return d
 
-            print('Artist: ' + self.artist)
-            print('Title: ' + self.title)
-            print('File Valid, Firing Callback Chain!')
-            d.callback(path)
+    def tagsRead(self, tags, transfer):
 
-        except Exception as err:
-            print('Error is ', err)
-            print('Firing Errback Chain!')
-            d.errback(err)
+        '''
+        Keeps the Tags with the Transfer, for its DB Entry
+        '''
+
+        transfer.filetype = tags['filetype']
+        transfer.artist = tags['artist']
+        transfer.title = tags['title']
+        transfer.album = tags['album']
+        transfer.genre = tags['genre']
+        transfer.duration = tags['duration']
 
-    def queueFile(self, path):
+        print('Artist: ' + transfer.artist)
+        print('Title: ' + transfer.title)
+        print('File Valid, Firing Callback Chain!')
+        return transfer
+
+    def queueFile(self, transfer):
 
         '''
         File Registration
 
-        - Adds File to the Queuing System
-        - Adds an Entry to the DB
+        - Stores Files by Content, Identical Uploads Share one Copy
+        - Returns a Deferred, Store File Continues with the Hash Lookup
         - Invokes Move File Method on Success
         - Invokes Invalid method on Failure
         '''
 
-        # Replace any Empty Space or Special Characters in the Song Title
-        title = re.sub('[^\w\-_\.]', '-', self.title)
-        # title = self.title.replace(' ', '-')
-        self.dst = self.factory.dir + title + '.mp3'
-        self.temp_f_name
+        d = self.lookupHash(transfer.digest)
+        d.addCallback(self.storeFile, transfer)
+        return d
 
-        # If the File does not exist in the Default Directory, Create It
-        if not os.path.isfile(self.dst):
-            os.system('touch {}'.format(self.dst))
+    def storeFile(self, row, transfer):
 
-        # Create a String with the Users Mac ID & File Path
-        user_path = self.mac_id + ':' + str(self.dst)
+        '''
+        Files the Upload under its Content Hash
 
-        # If this String Does Not Exist in the Queue
-        if user_path not in self.factory.q:
+        - Adds a Duplicate to the Queuing System Now, it is Already Stored
+        - Adds an Entry to the DB (New Content Only)
+        '''
 
-            print('Path not already Queued!\n'
-                  'Adding ....')
+        # If this Content is Already Stored, Reuse it
+        if row is not None and os.path.isfile(row.path):
 
-            # Add Path to the Queue System
-            self.factory.q.append(user_path)
-            print('Added! :) ')
+            print('Duplicate Upload of ' + row.path)
+            transfer.dst = row.path
+            transfer.file = row
+            transfer.duplicate = True
+            self.queuePath(transfer.dst)
+            return transfer
+
+        # Content-Addressed Location, Sharded on the First Hex Digits
+        hexdigest = transfer.digest.split(':')[-1]
+        shard = self.factory.dir + hexdigest[:2] + '/'
+        transfer.dst = shard + hexdigest + transfer.filetype
+
+        # If the Shard does not exist in the Default Directory, Create It
+        if not os.path.isdir(shard):
+            os.makedirs(shard)
 
         # Create a Dict obj for the new DB File entry
         details = {'Model': 'Files',
-                   'filetype': '.mp3',
-                   'artist': self.artist,
-                   'path': self.dst,
-                   'title': self.title,
-                   'user_id': self.factory.clients[self.client].user_id,
-                   'size': self.sizeTotal
+                   'filetype': transfer.filetype,
+                   'artist': transfer.artist,
+                   'path': transfer.dst,
+                   'title': transfer.title,
+                   'album': transfer.album,
+                   'genre': transfer.genre,
+                   'duration': transfer.duration,
+                   'hash': transfer.digest,
+                   'user_id': self.user.user_id,
+                   'size': transfer.size
                    }
 
-        # Use 'With' so the Instance is Garbage Collected
+        # Create the File DB Entry
         print('Adding Entry to the DB ....')
-        with NukeBoxQuery() as nbq:
+        d = self.factory.db.create(details)
+        d.addCallback(self.fileCreated, transfer)
+        return d
+
+    def fileCreated(self, row, transfer):
+
+        '''
+        Keeps the New DB Entry with the Transfer
+        '''
 
-            # Create the File DB Entry
-            self.file = nbq.create(details)
         print('DB Appended! :) ')
+        transfer.file = row
+        return transfer
 
-    def moveFile(self, result):
+    def moveFile(self, transfer):
 
         '''
         Transfers the Temp File to the Default save Directory
 
+        - Duplicates are Discarded, the Stored Copy is Kept
+        - Adds New Files to the Queuing System, once they are in Place
+        - Queues it for any Guests that Asked for it while it Arrived
+        - Has the Track's Loudness Measured, if it Hasn't Been
         - Ends Callback Chain
         '''
 
-        print('Moving File ....')
-        move(self.temp_f_name, self.dst)
-        print('File Moved! :) ')
+        if transfer.duplicate:
+            os.remove(transfer.temp_f_name)
+            print('Duplicate Discarded! :) ')
+
+        else:
+            print('Moving File ....')
+            move(transfer.temp_f_name, transfer.dst)
+            print('File Moved! :) ')
+
+            # Only Now can the Player Find it
+            self.queuePath(transfer.dst)
+
+        # Guests who Asked for the Content while it was Arriving
+        for mac_id in self.factory.guests.pop(transfer.name, []):
+            self.queuePath(transfer.dst, mac_id)
+
+        if transfer.file is not None:
+            self.factory.measure(transfer.file)
+
         print('End of Callback Chain! :) ')
 
-    def invalidFile(self, failure):
+        # The Transfer is Finished With
+        self.transfers.pop(transfer.tid, None)
+
+    def invalidFile(self, failure, transfer):
 
         '''
         Reports Invalid File
 
-        - Receives a Exception
+        - Receives a Failure (e.g. MetaError)
         - Removes the Temp File if needs be
         - Ends the Errback Chain
         '''
 
-        print('Invalid!')
-        # print(str(failure))
+        print('Invalid! {}'.format(failure.getErrorMessage()))
+        self.factory.guests.pop(transfer.name, None)
 
         # If the Temp File Exists, Remove it
         try:
-            os.remove(self.temp_f_name)
-            delattr(self, 'temp_f_name')
+            os.remove(transfer.temp_f_name)
 
-        except:
+        except OSError:
             print('No Temp File to Delete :) ')
 
         finally:
-            # Return the Failure obj
+            # The Transfer is Finished With
+            self.transfers.pop(transfer.tid, None)
             print('End of Errback Chain! :) ')
 
 
@@ -329,10 +1187,20 @@ class NukeboxFactory(protocol.ServerFactory):
           - One for each new connection
     '''
 
-    def __init__(self, q, default_dir, temp_dir):
+    def __init__(self, q, default_dir, temp_dir,
+                 write_buffer=65536, preallocate=True, db=None,
+                 loudness=None, transcoder=None, admission=None):
 
         '''
         Constructor for the Nukebox Factory object
+
+          - write_buffer bounds the bytes held in memory per upload
+          - preallocate reserves disk space for the announced size
+          - db is the NukeBoxAsyncDB Shared by every Connection
+          - loudness is the NukeBoxLoudness Measuring New Tracks
+          - transcoder is the NukeBoxTranscode Converting Queued Tracks,
+            by Default One is Made if the Config Enables it
+          - admission is the NukeBoxAdmission Limiting Sessions & Uploads
         '''
 
         # Build the Instance Variables
@@ -346,10 +1214,43 @@ class NukeboxFactory(protocol.ServerFactory):
         # Temporary Save Location
         self.temp = temp_dir
 
+        # Streaming Ingest Settings
+        self.write_buffer = write_buffer
+        self.preallocate = preallocate
+
         # Currently Registered Clients Dictionary
         # Might Not Need This For Our Purposes !!
         self.clients = {}
 
+        # Partial Uploads Currently being Written, by Temp Name, & the
+        # mac_ids of Guests to Queue each for once it Arrives
+        self.uploads = {}
+        self.guests = {}
+
+        # Limits on Sessions, Uploads & Client Rates, Shared by every
+        # Session so a Burst of Uploads Waits rather than Swamping us
+        self.admission = admission or NukeBoxAdmission(temp_dir)
+
+        # Non-Blocking DB Access, Queries Run in a Thread Pool
+        self.db = db or NukeBoxAsyncDB()
+
+        # Loudness Analysis, the Content Hashes being Measured & those
+        # that couldn't be (they Play at their Own Level, see measure)
+        self.loudness = loudness or NukeBoxLoudness()
+        self.measuring = set()
+        self.unmeasurable = set()
+
+        # Gains of the Tracks Queued, by Path, Read here so the Player
+        # never Waits on the DB (see trackGain)
+        self.gains = {}
+        for entry in q:
+            self.lookupGain(entry.split(':', 1)[1])
+
+        # Background Conversion to the Canonical Playback Format (Optional)
+        if transcoder is None and config.getboolean('transcode', 'enabled'):
+            transcoder = NukeBoxTranscode(q)
+        self.transcoder = transcoder
+
         print('********  Server Up!  ********')
 
     def buildProtocol(self, addr):
@@ -363,6 +1264,100 @@ class NukeboxFactory(protocol.ServerFactory):
         # Build the Protocol Instance
         return NukeBoxProtocol(self)
 
+    def measure(self, row):
+
+        '''
+        Measures a Stored Track's Loudness, Once per Content
+
+          - Runs in the Loudness Process Pool, the Gain is Stored on the
+            Files Row for Playback
+          - Tracks Already Measured, being Measured, or that Failed
+            are Skipped
+        '''
+
+        if row.gain is not None or row.hash in self.measuring or \
+                row.hash in self.unmeasurable:
+            return
+
+        self.measuring.add(row.hash)
+
+        d = self.loudness.analyze(row.path)
+        d.addCallback(self.measured, row)
+        d.addErrback(self.measureFailed, row)
+        d.addBoth(lambda _: self.measuring.discard(row.hash))
+
+    def transcode(self, path):
+
+        '''
+        Has a Stored Track Converted to the Canonical Format, in the
+        Background, if Transcoding is Enabled
+        '''
+
+        if self.transcoder is not None:
+            self.transcoder.submit(path)
+
+    def lookupGain(self, path):
+
+        '''
+        Reads a Queued Track's Gain into self.gains, for the Player
+
+          - Tracks not yet Measured (e.g. Imported) are Measured
+        '''
+
+        if isinstance(path, str):
+            path = path.decode(FS_ENCODING)
+
+        if path in self.gains:
+            return
+
+        d = self.db.read(**{'Model': 'Files', 'path': path})
+        d.addCallback(self.gainFound, path)
+
+        # Not in the DB (e.g. Removed), it Plays at its Own Level
+        d.addErrback(lambda _: None)
+
+    def gainFound(self, row, path):
+
+        '''
+        Keeps a Track's Stored Gain, or has it Measured
+        '''
+
+        if row.gain is None:
+            self.measure(row)
+        else:
+            self.gains[path] = row.gain
+
+    def measured(self, gain, row):
+
+        '''
+        Stores a Measured Gain on the Files Row
+        '''
+
+        # Silence, Nothing to Adjust, but Measured all the Same
+        if gain is None:
+            gain = 0.0
+
+        print('Gain for {}: {:+.2f} dB'.format(row.path, gain))
+
+        self.gains[row.path] = gain
+
+        return self.db.update(**{'Model': 'Files',
+                                 'column': 'path',
+                                 'value': row.path,
+                                 'gain': gain})
+
+    def measureFailed(self, failure, row):
+
+        '''
+        Reports a Failed Analysis, the Track Plays at its Own Level
+
+          - It isn't Tried again (until the Server Restarts)
+        '''
+
+        self.unmeasurable.add(row.hash)
+        print('Loudness Analysis Failed for {}: {}'.format(
+            row.path, failure.getErrorMessage()))
+
 
 class NukeBoxBroadcastReceiver(protocol.DatagramProtocol):
 
@@ -410,48 +1405,51 @@ class NukeBoxBroadcastReceiver(protocol.DatagramProtocol):
                                  addr)
 
 
-def main():
+def trackGain(factory, path):
 
     '''
-    Main function
-    '''
+    Returns a Track's Gain, or None if it has None (yet)
 
-    def playBack():
+      - Called from the Playback Thread, so it never Waits on the DB,
+        Gains are Read as Tracks are Queued (see lookupGain)
+      - A Track Missed there is Looked up for Next Time
+    '''
 
-        '''
-        File PlayBack Function
+    if isinstance(path, str):
+        path = path.decode(FS_ENCODING)
 
-          - Runs in Thread of its own
-          - Continues to check the Queue for new entries
-          - Calls VLC CLI command to play file
-        '''
+    gain = factory.gains.get(path)
 
-        print('Playback called!')
+    if gain is None:
+        reactor.callFromThread(factory.lookupGain, path)
 
-        # While the Server is UP
-        while True:
+    return gain
 
-            # If there is an Entry in the Queue
-            if len(q) > 0:
 
-                # Pull the Entry at Index 0
-                user_path = q.popleft()
+def playBack(q, sink='aplay', factory=None):
 
-                # Split the String into a User ID & File Path
-                mac_id, path = user_path.split(':')
+    '''
+    File PlayBack Function
+
+      - Runs in Thread of its own
+      - Sleeps on the Queue until an Entry Arrives (no Polling)
+      - Plays Gaplessly through one Persistent Sink (see NukeBoxPlayer)
+      - Normalises Loudness with the Gains the Factory Stores, if Given
+      - Plays the Transcoded Copies, if the Factory Makes them
+      - Returns once the Queue is Closed
+    '''
 
-                print('User {} - Playing {}').format(mac_id, path)
+    gain = functools.partial(trackGain, factory) if factory else None
+    locate = playable if factory and factory.transcoder else None
 
-                # If the File Does Exist
-                if os.path.isfile(path):
+    NukeBoxPlayer(q, makeSink(sink), gain, locate).run()
 
-                    print('File Exists')
 
-                    # Create a String to Call CLVC (VLC command line!)
-                    file = 'cvlc --play-and-exit {}'.format(path)
+def main():
 
-                    # Execute the Command in a Sub Process
-                    subprocess.call(file, shell=True)
+    '''
+    Main function
+    '''
 
     def cleanUp(signal, frame):
 
@@ -459,12 +1457,10 @@ def main():
         Called to Exit somewhat gracefully
         '''
 
+        q.close()
         reactor.stop()
         os._exit(0)
 
-    # Create the Double Ended Queue (Deque)
-    q = NukeBoxQueue()
-
     # Create a Reference to the Users Home Dir
     HOME = os.path.expanduser('~')
 
@@ -480,6 +1476,9 @@ def main():
     if not os.path.isdir(temp_dir):
         os.makedirs(temp_dir)
 
+    # Create the Play Queue, Recovering it from its Journal
+    q = NukeBoxQueue(NukeBoxJournal(default_dir + '.queue.journal'))
+
     # Create the Factory Instance
     f = NukeboxFactory(q, default_dir, temp_dir)
 
@@ -492,11 +1491,15 @@ def main():
     # Notify the Reactor to Listen for UDP Connections
     reactor.listenUDP(9009, protocol)
 
+    # Connect to the DB in the Background, once we're Listening
+    reactor.callWhenRunning(f.db.warmUp)
+
     # Add the Shutdown Signal Handler
     signal.signal(signal.SIGINT, cleanUp)
 
-    # Defer the Playback Function to its Own Thread
-    deferToThread(playBack)
+    # Defer the Playback Function to its Own Thread, the Sink can be
+    # Swapped (e.g. NUKEBOX_PLAYER_SINK=null) for Testing without a Sound Card
+    deferToThread(playBack, q, config.get('player', 'sink'), f)
 
     # Run the Reactor
     reactor.run()